@@ -0,0 +1,128 @@
+# ╭─────────────────────────────────────────────────────────────────────────╮
+# │ Benchmarks                                                              │
+# ├─────────────────────────────────────────────────────────────────────────┤
+# │ Times the main parts of ff1_asset_swapper.py on ROMs made by            │
+# │ synthetic_rom.py, so changes can be measured without a real ROM.        │
+# │                                                                         │
+# │ parse        Parsing the name and allocation tables from scratch        │
+# │ cached load  Loading the same index from the '.index' cache             │
+# │ lookups      `get_path` over every path in the ROM                      │
+# │ characters   Matching every character's models onto Hunter's, without   │
+# │              writing anything or reusing cached plans                   │
+# │ moves        Writing a swap of every model in `model/fieldchar`         │
+# ├─────────────────────────────────────────────────────────────────────────┤
+# │ Usage                                                                   │
+# ├─────────────────────────────────────────────────────────────────────────┤
+# │ python benchmark.py [--json] [size...]                                  │
+# │                                                                         │
+# │ size                                                                    │
+# │     Any of "small", "medium" and "large" (default: all of them).        │
+# │                                                                         │
+# │ --json                                                                  │
+# │     Prints the results as JSON instead of a table.                      │
+# ╰─────────────────────────────────────────────────────────────────────────╯
+
+from contextlib import redirect_stdout
+from io import StringIO
+from json import dumps
+from os.path import getsize, join
+from sys import argv
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from ff1_asset_swapper import Rom, Session, create_file_structure, cached_file_structure, get_character
+from synthetic_rom import write_rom
+
+SIZES = {
+	"small": dict(directories=64, files_per_directory=16),
+	"medium": dict(directories=1000, files_per_directory=16),
+	"large": dict(directories=3000, files_per_directory=16, asset_size=0x1000),
+}
+
+def best_time(function, repeat=5):
+	best = None
+	for _ in range(repeat):
+		start = perf_counter()
+		result = function()
+		elapsed = perf_counter() - start
+		if best is None or elapsed < best:
+			best = elapsed
+	return best, result
+
+def benchmark(directory, size):
+	nds_file = join(directory, f"{size}.nds")
+	write_rom(nds_file, **SIZES[size])
+	rom = Rom(nds_file, cache=False)
+	
+	parse_time, _ = best_time(lambda: create_file_structure(rom))
+	cached_file_structure(rom)
+	cached_load_time, _ = best_time(lambda: cached_file_structure(rom))
+	
+	root = rom.root
+	paths = [path for path, _ in root.walk()]
+	lookup_time, _ = best_time(lambda: [root.get_path(path) for path in paths])
+	
+	def match_characters():
+		# plans are cached on the index, so every run starts without them
+		root.characters.plans.clear()
+		session = Session(rom, join(directory, "characters.nds"))
+		hunters = get_character(root, 1, "")
+		# models with no source are listed as they're planned, which would get in the way of the results
+		with redirect_stdout(StringIO()):
+			for character_number in range(48):
+				session.move_character(get_character(root, character_number, ""), hunters)
+		return len(session.plan.moves)
+	characters_time, planned_moves = best_time(match_characters)
+	
+	models = root.get_path("model/fieldchar").children
+	moved_bytes = sum(x.length for x in models)
+	def write_moves():
+		session = Session(rom, join(directory, "moves.nds"), copy_rom=False)
+		for source, destination in zip(models, reversed(models)):
+			if source.length == destination.length:
+				session.move(source, destination)
+		session.write()
+	session = Session(rom, join(directory, "moves.nds"))
+	session.write()
+	moves_time, _ = best_time(write_moves)
+	
+	rom.close()
+	return {
+		"size": size,
+		"rom_bytes": getsize(nds_file),
+		"files": len(paths),
+		"parse_seconds": parse_time,
+		"cached_load_seconds": cached_load_time,
+		"lookups_per_second": len(paths) / lookup_time,
+		"character_matching_seconds": characters_time,
+		"planned_moves": planned_moves,
+		"move_bytes_per_second": moved_bytes / moves_time,
+	}
+
+def main():
+	arguments = argv[1:]
+	as_json = "--json" in arguments
+	sizes = [x for x in arguments if x != "--json"] or list(SIZES)
+	
+	with TemporaryDirectory() as directory:
+		results = [benchmark(directory, size) for size in sizes]
+	
+	if as_json:
+		print(dumps(results, indent=2))
+		return
+	
+	print(f"{'size':<8}{'ROM':>10}{'files':>8}{'parse':>11}{'cached':>11}{'lookups/s':>12}{'characters':>12}{'moves':>12}")
+	for result in results:
+		print(
+			f"{result['size']:<8}"
+			f"{result['rom_bytes'] / 0x100000:>8.1f}MB"
+			f"{result['files']:>8}"
+			f"{result['parse_seconds'] * 1000:>9.2f}ms"
+			f"{result['cached_load_seconds'] * 1000:>9.2f}ms"
+			f"{result['lookups_per_second']:>12.0f}"
+			f"{result['character_matching_seconds'] * 1000:>10.2f}ms"
+			f"{result['move_bytes_per_second'] / 0x100000:>8.1f}MB/s"
+		)
+
+if __name__ == "__main__":
+	main()
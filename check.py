@@ -0,0 +1,159 @@
+# ╭─────────────────────────────────────────────────────────────────────────╮
+# │ Checks                                                                  │
+# ├─────────────────────────────────────────────────────────────────────────┤
+# │ Checks that ff1_asset_swapper.py still writes the right bytes, using    │
+# │ ROMs made by synthetic_rom.py, so changes can be tested without a real  │
+# │ ROM.                                                                    │
+# │                                                                         │
+# │ swaps        Swapping Hunter with a character gives the same ROM as the │
+# │              original script's one-move-at-a-time swap                  │
+# │ patches      Applying an IPS or BPS patch gives the same ROM as writing │
+# │              the swap directly                                          │
+# │ pointers     Every model reads back the same in pointer mode            │
+# │ compression  LZ10, LZ11, Huffman, and RLE data decompresses to what was │
+# │              compressed                                                 │
+# │ journal      Updating an output ROM through its journal gives the same  │
+# │              ROM as building it from scratch                            │
+# ├─────────────────────────────────────────────────────────────────────────┤
+# │ Usage                                                                   │
+# ├─────────────────────────────────────────────────────────────────────────┤
+# │ python check.py                                                         │
+# │                                                                         │
+# │ Prints each check as it runs, and exits with an error if any failed.    │
+# ╰─────────────────────────────────────────────────────────────────────────╯
+
+from contextlib import redirect_stdout
+from io import StringIO
+from os.path import join
+from random import Random
+from tempfile import TemporaryDirectory
+
+from ff1_asset_swapper import Rom, Session, CharacterInfo, swap_with_hunter, parse_character, apply_patch, compress, decompress, LZ10, LZ11, HUFFMAN4, HUFFMAN8, RLE
+from synthetic_rom import build_tree, write_rom
+
+CHARACTERS = ["2", "3", "11b", "1c", "46"]
+
+def reference_swap(models, character_spec, weird_sprint=True):
+	# the original script's swap, one move at a time, on the generated files instead of a ROM
+	character_number, character_variation = parse_character(character_spec)
+	info = {name: CharacterInfo.from_name(name) for name in models}
+	output = dict(models)
+	
+	def get_character(character_number, variation):
+		return [name for name in models if info[name].character_number == character_number and (not variation or info[name].variation in [variation, ""])]
+	
+	def move_character(sources, destinations):
+		for source in sources:
+			for destination in destinations:
+				if (info[destination].special_trait, info[destination].animation_number) == (info[source].special_trait, info[source].animation_number):
+					output[destination] = models[source]
+		
+		if weird_sprint and not [x for x in sources if info[x].animation_number == 3]:
+			walking_model = [x for x in sources if info[x].animation_number == 2][0]
+			for destination in destinations:
+				if info[destination].animation_number == 3:
+					output[destination] = models[walking_model]
+	
+	all_hunters = get_character(1, "")
+	hunter_deinonychus = get_character(1, "c")
+	input_character = get_character(character_number, character_variation)
+	move_character(input_character, all_hunters)
+	move_character(hunter_deinonychus, input_character)
+	return output
+
+def expected_rom(rom, models):
+	expected = bytearray(rom.map)
+	for name, data in models.items():
+		file = rom.root.get_path(f"model/fieldchar/{name}")
+		expected[file.start_address:file.start_address + file.length] = data
+	return bytes(expected)
+
+def read_file(file_name):
+	with open(file_name, "rb") as file:
+		return file.read()
+
+def build(rom, output_nds_file, character_spec, **options):
+	with redirect_stdout(StringIO()):
+		session = Session(rom, output_nds_file, **options)
+		swap_with_hunter(session, *parse_character(character_spec))
+		session.write()
+
+def check_swaps(rom, models, directory):
+	for weird_sprint in [True, False]:
+		for character_spec in CHARACTERS:
+			output_nds_file = join(directory, f"swap {character_spec}.nds")
+			build(rom, output_nds_file, character_spec, weird_sprint=weird_sprint, incremental=False)
+			yield f"swap {character_spec}{'' if weird_sprint else ' without weird sprint'}", read_file(output_nds_file) == expected_rom(rom, reference_swap(models, character_spec, weird_sprint))
+
+def check_patches(rom, models, directory):
+	for patch_format in ["ips", "bps"]:
+		for character_spec in CHARACTERS:
+			direct_nds_file = join(directory, f"direct {character_spec}.nds")
+			patch_file = join(directory, f"patch {character_spec}.{patch_format}")
+			patched_nds_file = join(directory, f"patched {character_spec}.nds")
+			build(rom, direct_nds_file, character_spec, incremental=False)
+			build(rom, patch_file, character_spec, patch_format=patch_format)
+			apply_patch(patch_file, rom.path, patched_nds_file)
+			yield f"{patch_format} {character_spec}", read_file(patched_nds_file) == read_file(direct_nds_file)
+
+def check_pointers(rom, models, directory):
+	for character_spec in CHARACTERS:
+		output_nds_file = join(directory, f"pointers {character_spec}.nds")
+		build(rom, output_nds_file, character_spec, pointer_mode=True, incremental=False)
+		
+		expected = reference_swap(models, character_spec)
+		output_rom = Rom(output_nds_file, cache=False)
+		try:
+			passed = all(bytes(output_rom.contents(output_rom.root.get_path(f"model/fieldchar/{name}"))) == data for name, data in expected.items())
+		finally:
+			output_rom.close()
+		yield f"pointers {character_spec}", passed
+
+def check_compression(rom, models, directory):
+	random = Random(0)
+	samples = {
+		"empty": b"",
+		"random": random.randbytes(0x2000),
+		"repeated": b"MM3\0" * 0x1000,
+		"long run": bytes(0x12000) + b"end",
+		"models": b"".join(models.values()),
+		"mixed": bytes(random.choice(b"abc\0") for _ in range(0x4000)),
+		"one byte": b"a",
+		"every byte": bytes(range(0x100)) * 4,
+	}
+	for kind, kind_name in [(LZ10, "lz10"), (LZ11, "lz11"), (HUFFMAN4, "4-bit huffman"), (HUFFMAN8, "8-bit huffman"), (RLE, "rle")]:
+		for sample_name, data in samples.items():
+			yield f"{kind_name} {sample_name}", decompress(compress(data, kind)) == data
+
+def check_journal(rom, models, directory):
+	output_nds_file = join(directory, "journal.nds")
+	# every step reuses the last one's output, and is compared to a fresh build of the same character
+	for step, (character_spec, options) in enumerate([("2", {}), ("3", {}), ("3", {}), ("11b", {}), ("2", dict(pointer_mode=True)), ("46", {})]):
+		fresh_nds_file = join(directory, f"fresh {step}.nds")
+		build(rom, output_nds_file, character_spec, **options)
+		build(rom, fresh_nds_file, character_spec, incremental=False, **options)
+		yield f"journal {step + 1} ({character_spec})", read_file(output_nds_file) == read_file(fresh_nds_file)
+
+CHECKS = [check_swaps, check_patches, check_pointers, check_compression, check_journal]
+
+def main():
+	failures = 0
+	with TemporaryDirectory() as directory:
+		nds_file = join(directory, "synthetic.nds")
+		write_rom(nds_file)
+		models = build_tree()["model"]["fieldchar"]
+		rom = Rom(nds_file, cache=False)
+		
+		for check in CHECKS:
+			for name, passed in check(rom, models, directory):
+				print(f"{'ok' if passed else 'FAILED'}  {name}")
+				failures += not passed
+		rom.close()
+	
+	if failures:
+		print(f"\n{failures} checks failed")
+		exit(1)
+	print("\nAll checks passed")
+
+if __name__ == "__main__":
+	main()
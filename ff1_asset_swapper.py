@@ -81,7 +81,34 @@
 # │ Usage                                                                   │
 # ├─────────────────────────────────────────────────────────────────────────┤
 # │ python ff1_asset_swapper.py [DEBUG] [CUSTOM_MODE] [WEIRD_SPRINT]        │
-# │      input_nds_file output_name character_number[variation]             │
+# │      [POINTER_MODE] [MM3_MODE] [PATCH_MODE] [STATS] [DEDUP] [VERIFY]    │
+# │      [FULL_HASH] input_nds_file output_name                             │
+# │      character_number[variation]                                        │
+# │                                                                         │
+# │ python ff1_asset_swapper.py [DEBUG] [WEIRD_SPRINT] [POINTER_MODE]       │
+# │      [MM3_MODE] [PATCH_MODE] [STATS] [DEDUP] [VERIFY] [FULL_HASH]       │
+# │      batch input_nds_file [character_number[variation]...]              │
+# │                                                                         │
+# │ python ff1_asset_swapper.py [DEBUG] [WEIRD_SPRINT] [POINTER_MODE]       │
+# │      [MM3_MODE] [PATCH_MODE] [STATS] [DEDUP] [VERIFY] [FULL_HASH]       │
+# │      plan plan_file input_nds_file output_name                          │
+# │                                                                         │
+# │ python ff1_asset_swapper.py apply patch_file input_nds_file             │
+# │      [output_nds_file]                                                  │
+# │                                                                         │
+# │ python ff1_asset_swapper.py duplicates input_nds_file                   │
+# │                                                                         │
+# │ python ff1_asset_swapper.py list input_nds_file [pattern] [listing_file]│
+# │                                                                         │
+# │ python ff1_asset_swapper.py extract input_nds_file output_directory     │
+# │      [pattern]                                                          │
+# │                                                                         │
+# │ python ff1_asset_swapper.py repack input_nds_file input_directory       │
+# │      [output_nds_file]                                                  │
+# │                                                                         │
+# │ python ff1_asset_swapper.py models input_nds_file [pattern]             │
+# │                                                                         │
+# │ python ff1_asset_swapper.py coverage input_nds_file                     │
 # │                                                                         │
 # │ Note: At any point, all remaining arguments may be omitted, and will be │
 # │       prompted for at runtime, but options that are provided MUST be    │
@@ -94,9 +121,10 @@
 # │     When this is set to "custom", 'custom mode' is activated.           │
 # │     In custom mode, the default behavior is skipped, and all            │
 # │     arguments after `WEIRD_SPRINT` are ignored. This allows custom      │
-# │     commands to be added to the bottom of the script that will only     │
-# │     be run in custom mode. For information on how to write custom       │
-# │     commands, see `Commands` at the bottom of the script.               │
+# │     commands to be added to `custom_commands` at the bottom of the      │
+# │     script, which will only be run in custom mode. For information on   │
+# │     how to write custom commands, see `Commands` at the bottom of the   │
+# │     script.                                                             │
 # │                                                                         │
 # │ WEIRD_SPRINT                                                            │
 # │     WEIRD_SPRINT is a feature that allows for moving characters         │
@@ -110,19 +138,158 @@
 # │     Setting this to "--disable-weird-sprint" or "-d" disables this      │
 # │     functionality.                                                      │
 # │                                                                         │
+# │     Every character move is planned in full before anything is added,   │
+# │     so a character with neither animation stops with an error before    │
+# │     anything is written, and models with no source are listed first.    │
+# │     Other fallbacks can be set with `Session`'s `fallbacks`, see        │
+# │     `Commands` at the bottom of the script.                             │
+# │                                                                         │
+# │ POINTER_MODE                                                            │
+# │     Setting this to "--pointers" or "-p" makes moves rewrite the file   │
+# │     allocation table instead of copying data. The destination file is   │
+# │     pointed at the source file's data, so only 8 bytes are written per  │
+# │     move, and the two files no longer need to be the same size.         │
+# │                                                                         │
+# │ MM3_MODE                                                                │
+# │     Setting this to "--mm3" makes moves rewrite MM3 asset files instead │
+# │     of copying them. The destination is decompressed, its indexes are   │
+# │     replaced with the source's, and it's compressed again the same way  │
+# │     it was before, keeping its table names, so the two files don't need │
+# │     to be the same size. A model that grows is moved to the end of the  │
+# │     ROM, like with `repack`, so the whole output ROM is written again   │
+# │     every time. Both models need the same number of indexes. This can't │
+# │     be used with POINTER_MODE or PATCH_MODE.                            │
+# │                                                                         │
+# │ PATCH_MODE                                                              │
+# │     Setting this to "--ips" or "--bps" writes an IPS or BPS patch       │
+# │     instead of a full output ROM, named like the output ROM but with    │
+# │     a '.ips' or '.bps' extension. IPS patches can't change anything     │
+# │     past the first 16 MB of the ROM, so BPS is usually the better pick. │
+# │                                                                         │
+# │     Patches can be applied with any patcher, or with `apply`, which     │
+# │     writes the patched ROM to output_nds_file ('[patch_file].nds' by    │
+# │     default).                                                           │
+# │                                                                         │
+# │ STATS                                                                   │
+# │     Setting this to "--stats" prints how long each phase took (parsing  │
+# │     the name table, resolving the file allocation table, copying the    │
+# │     ROM, planning and writing moves), and how many files were opened,   │
+# │     seeks, writes, and bytes were read and written, in total and per    │
+# │     move. Setting it to "--stats=[json_file]" also saves the same       │
+# │     numbers to json_file. In batch mode, every variant is included.     │
+# │                                                                         │
+# │ DEDUP                                                                   │
+# │     Setting this to "--dedup" hashes every file in the ROM first, and   │
+# │     skips any move whose destination already has the same contents as   │
+# │     its source. Many models are byte-for-byte identical, so this can    │
+# │     save a lot of writing on big swaps, at the cost of reading the      │
+# │     whole ROM once.                                                     │
+# │                                                                         │
+# │ VERIFY                                                                  │
+# │     Setting this to "--verify" checks the output ROM after writing it.  │
+# │     Only the ranges written by this run are read back, hashed in        │
+# │     parallel, and compared to the data that should be there, along      │
+# │     with the header checksum and the ROM's size. Each file passes or    │
+# │     fails on its own, and any failure stops with an error. This can't   │
+# │     be used with PATCH_MODE.                                            │
+# │                                                                         │
+# │ FULL_HASH                                                               │
+# │     Setting this to "--full-hash" hashes the whole input ROM and        │
+# │     checks it against the index cache, instead of trusting its size,    │
+# │     modification time, and header checksum. This is slower, but catches │
+# │     a ROM that was changed without any of those changing.               │
+# │                                                                         │
+# │ duplicates                                                              │
+# │     Lists every group of files with identical contents, biggest         │
+# │     savings first.                                                      │
+# │                                                                         │
+# │ list                                                                    │
+# │     Lists every file and directory in the ROM with its id, offset, and  │
+# │     size, or only the ones matching pattern, a glob like                │
+# │     "model/fieldchar/cha01?_*". If listing_file ends in '.csv' or       │
+# │     '.json', the list is saved to it instead of printed.                │
+# │                                                                         │
+# │ extract                                                                 │
+# │     Saves every file in the ROM to output_directory, keeping the ROM's  │
+# │     directories, or only the files in a directory or matching a         │
+# │     pattern like "model/fieldchar". Files are read in the order they    │
+# │     are stored in the ROM, and written in parallel.                     │
+# │                                                                         │
+# │ repack                                                                  │
+# │     The opposite of extract: every file in input_directory that's       │
+# │     different from the same file in input_nds_file is put back, and     │
+# │     the result is saved to output_nds_file ('[input file name] -        │
+# │     repacked.nds' by default). Files that are the same size or smaller  │
+# │     are written over the old data, and larger files are moved to the    │
+# │     end of the ROM, with the file allocation table and header updated   │
+# │     to match. Files that aren't already in the ROM are ignored.         │
+# │                                                                         │
+# │ models                                                                  │
+# │     Decompresses every MM3 asset file in "model/fieldchar", or the ones │
+# │     matching pattern, and prints its compression and indexes. LZ10,     │
+# │     LZ11, Huffman, and RLE compression are all supported.               │
+# │                                                                         │
+# │ coverage                                                                │
+# │     Lists every character and variation with how many models it has,    │
+# │     and which of Hunter's animations it's missing, marking the ones     │
+# │     that WEIRD_SPRINT fills in.                                         │
+# │                                                                         │
+# │ batch                                                                   │
+# │     Swaps Hunter with each of the given characters, making one output   │
+# │     per character, named '[input file name] - [character].nds'. The     │
+# │     input ROM is only read once, and the outputs are built in parallel. │
+# │     Passing "all" (the default) builds every character and variation.   │
+# │     A character that fails is reported, and doesn't stop the others.    │
+# │     Every character's moves are planned once before the outputs are     │
+# │     built, and reused by each of them.                                  │
+# │                                                                         │
+# │ plan                                                                    │
+# │     Runs the operations in plan_file instead of swapping with Hunter,   │
+# │     without needing to edit the script. plan_file is JSON (or TOML,     │
+# │     with Python 3.11+) with a list of operations, each one of "move",   │
+# │     "swap", "move_matching", "swap_matching", "move_character", or      │
+# │     "swap_characters", given a source and a destination, like the       │
+# │     `session` commands at the bottom of the script. Paths are full      │
+# │     paths in the ROM (or patterns, for "move_matching" and              │
+# │     "swap_matching"), and characters are written like                   │
+# │     character_number[variation], or like "1*" for every variation of a  │
+# │     character:                                                          │
+# │                                                                         │
+# │     {"operations": [                                                    │
+# │       {"move": ["model/fieldchar/head02", "model/fieldchar/head01a"]},  │
+# │       {"swap_characters": ["1*", "2"]}                                  │
+# │     ]}                                                                  │
+# │                                                                         │
+# │     The whole plan is resolved before anything is written. Every        │
+# │     destination only gets its last source, so writes that a later       │
+# │     operation overwrites are skipped, and moves that put a file back    │
+# │     in its own place are dropped. The resolved plan is printed, along   │
+# │     with any conflicts, where one destination was given two different   │
+# │     sources.                                                            │
+# │                                                                         │
 # │ input_nds_file                                                          │
 # │     The input ROM that data is read to. This is expected to be          │
 # │     unmodified, but should still work otherwise.                        │
 # │                                                                         │
+# │     The first time a ROM is used, an index of its files is saved next   │
+# │     to it as '[input_nds_file].index', so later runs don't need to      │
+# │     parse the ROM again. It's rebuilt whenever the ROM changes.         │
+# │                                                                         │
 # │ output_name                                                             │
 # │     Used to create the output ROM. Formatted as follows:                │
 # │     '[input file name] - [output_name].nds'                             │
 # │                                                                         │
+# │     Every output ROM gets a small journal next to it, named             │
+# │     '[output ROM].journal', listing what was written to it. If the      │
+# │     output ROM already exists and hasn't been changed since, it's       │
+# │     updated in place: only moves that changed are written, and          │
+# │     anything that's no longer moved is restored from the input ROM.     │
+# │                                                                         │
 # │ character_number                                                        │
 # │     If CUSTOM_MODE is not enabled, Hunter's model (all variations) will │
 # │     be replaced with this character's model and this character's model  │
 # │     will be replaced by Deinonychus Hunter (This can easily             │
-# │     be changed, see `Commands` at the bottom of the script).            │
+# │     be changed, see `swap_with_hunter` at the bottom of the script).    │
 # │                                                                         │
 # │ variation                                                               │
 # │     This optionally specifies which variation of the character's model  │
@@ -150,6 +317,24 @@
 # │                                                                         │
 # │   > python ff1_asset_swapper.py -d "Fossil Fighters.nds" "my mod"       │
 # │                                                                         │
+# │ Swaps Hunter and Rosie by only rewriting file pointers:                 │
+# │                                                                         │
+# │   > python ff1_asset_swapper.py -p "Fossil Fighters.nds" "Rosie mod" 2  │
+# │                                                                         │
+# │ Makes a BPS patch that swaps Hunter and Rosie, then applies it:         │
+# │                                                                         │
+# │   > python ff1_asset_swapper.py --bps "Fossil Fighters.nds" "Rosie" 2   │
+# │   > python ff1_asset_swapper.py apply "Fossil Fighters - Rosie.bps"     │
+# │                                                   "Fossil Fighters.nds" │
+# │                                                                         │
+# │ Makes one ROM for every character swapped with Hunter:                  │
+# │                                                                         │
+# │   > python ff1_asset_swapper.py batch "Fossil Fighters.nds" all         │
+# │                                                                         │
+# │ Shows where the time goes when swapping Hunter and Rosie:               │
+# │                                                                         │
+# │   > python ff1_asset_swapper.py --stats=stats.json "FF1.nds" "Rosie" 2  │
+# │                                                                         │
 # │ Swaps Hunter and Rosie:                                                 │
 # │                                                                         │
 # │   > python ff1_asset_swapper.py "Fossil Fighters.nds" "Rosie mod" 2     │
@@ -166,49 +351,284 @@
 # ╰─────────────────────────────────────────────────────────────────────────╯
 
 from shutil import copyfile
-from os import system
-from os.path import isfile
-from re import compile
-from sys import argv
+from os.path import isfile, join, dirname, getsize
+from re import compile, escape
+from sys import argv, byteorder
 from glob import glob
+from bisect import bisect_left
+from mmap import mmap, ACCESS_READ
+from struct import pack, unpack_from
+from zlib import crc32
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_all_start_methods, get_context
+from contextlib import redirect_stdout, contextmanager
+from io import StringIO
+from time import perf_counter
+from array import array
+from collections import Counter
+from heapq import heapify, heappush, heappop
+from hashlib import blake2b
+from threading import Thread
+from queue import Queue
+import marshal
+import os
+import json
+import csv
+
+try:
+	import tomllib
+except ImportError:
+	tomllib = None
+
+try:
+	from fcntl import ioctl
+except ImportError:
+	ioctl = None
+
+FICLONE = 0x40049409
 
 IS_EXE = argv[0].endswith("exe")
 
 character_regex = compile("(?P<model_type>cha|head)(?P<character_number>\\d+)(?P<variation>[a-h]?)_?(?P<special_trait>ice|rock|paralysis)?_?(?P<animation_number>\\d+)?")
 
+class SwapError(Exception):
+	pass
+
 def error(message):
 	print(f"\033[31m{message}\033[0m")
 	if IS_EXE:
 		input("Press Return to exit...")
 	exit()
 
-def inte(_bytes):
-	return int.from_bytes(_bytes, "little")
+def format_size(size):
+	for unit in ["B", "KB", "MB"]:
+		if size < 1024:
+			return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+		size /= 1024
+	return f"{size:.1f} GB"
+
+class Stats:
+	COUNTERS = ["opens", "seeks", "writes", "bytes_read", "bytes_written", "moves", "skipped_moves"]
+	
+	def __init__(self):
+		self.phases = {}
+		self.counters = dict.fromkeys(self.COUNTERS, 0)
+		self.active_phases = set()
+	
+	@contextmanager
+	def phase(self, name):
+		if name in self.active_phases:
+			yield
+			return
+		
+		self.active_phases.add(name)
+		start = perf_counter()
+		try:
+			yield
+		finally:
+			self.phases[name] = self.phases.get(name, 0) + perf_counter() - start
+			self.active_phases.remove(name)
+	
+	def count(self, name, amount=1):
+		self.counters[name] += amount
+	
+	def merge(self, other):
+		for name, seconds in other.phases.items():
+			self.phases[name] = self.phases.get(name, 0) + seconds
+		for name, amount in other.counters.items():
+			self.counters[name] += amount
+	
+	def report(self):
+		return {"phases": dict(self.phases), "counters": dict(self.counters)}
+	
+	@classmethod
+	def from_report(cls, report):
+		stats = cls()
+		stats.phases.update(report["phases"])
+		stats.counters.update(report["counters"])
+		return stats
+	
+	def summary(self):
+		lines = ["Phases:"]
+		for name, seconds in self.phases.items():
+			lines.append(f"    {name:<20}{seconds * 1000:10.2f} ms")
+		
+		counters = self.counters
+		lines.append("I/O:")
+		lines.append(f"    {'files opened':<20}{counters['opens']:10}")
+		lines.append(f"    {'seeks':<20}{counters['seeks']:10}")
+		lines.append(f"    {'writes':<20}{counters['writes']:10}")
+		lines.append(f"    {'read':<20}{format_size(counters['bytes_read']):>10}")
+		lines.append(f"    {'written':<20}{format_size(counters['bytes_written']):>10}")
+		if counters["skipped_moves"]:
+			lines.append(f"    {'skipped moves':<20}{counters['skipped_moves']:10}")
+		
+		moves = counters["moves"]
+		if moves:
+			lines.append(f"Per move ({moves} moves):")
+			lines.append(f"    {'seeks':<20}{counters['seeks'] / moves:10.2f}")
+			lines.append(f"    {'read':<20}{format_size(counters['bytes_read'] / moves):>10}")
+			lines.append(f"    {'written':<20}{format_size(counters['bytes_written'] / moves):>10}")
+		return "\n".join(lines)
+
+class Rom:
+	def __init__(self, nds_file, cache=True, full_hash=False):
+		self.path = nds_file
+		self.cache = cache
+		self.full_hash = full_hash
+		self.stats = Stats()
+		self.stats.count("opens")
+		self.file = open(nds_file, "rb")
+		self.map = mmap(self.file.fileno(), 0, access=ACCESS_READ)
+		self.view = memoryview(self.map)
+		self._root = None
+		self._content_index = None
+		self._decompressed = {}
+	
+	@property
+	def root(self):
+		if self._root is None:
+			if self.cache:
+				self._root = cached_file_structure(self, self.full_hash)
+			else:
+				self._root = create_file_structure(self)
+			self._root.rom = self
+		return self._root
+	
+	def unpack(self, format, offset):
+		return unpack_from(format, self.map, offset)
+	
+	def read(self, offset, length):
+		return self.view[offset:offset + length]
+	
+	def contents(self, file):
+		return self.read(file.start_address, file.length)
+	
+	def decompressed(self, file):
+		region = (file.start_address, file.length)
+		data = self._decompressed.get(region)
+		if data is None:
+			data = self._decompressed[region] = decompress(self.contents(file))
+		return data
+	
+	def content_index(self):
+		if self._content_index is None:
+			with self.stats.phase("hash contents"):
+				self._content_index = ContentIndex(self)
+		return self._content_index
+	
+	def close(self):
+		self.view.release()
+		self.map.close()
+		self.file.close()
+
+class FileTable:
+	def __init__(self, offset, data, base=0):
+		self.offset = offset
+		self.base = base
+		self.addresses = array("I")
+		self.addresses.frombytes(data[:len(data) - len(data) % 8])
+		if byteorder == "big":
+			self.addresses.byteswap()
+	
+	def start_address(self, id):
+		return self.base + self.addresses[id * 2]
+	
+	def end_address(self, id):
+		return self.base + self.addresses[id * 2 + 1]
+	
+	def entry_offset(self, id):
+		return self.offset + id * 8
+	
+	def pack_entry(self, start_address, length):
+		return pack("<II", start_address - self.base, start_address - self.base + length)
+	
+	def length(self, id):
+		return self.addresses[id * 2 + 1] - self.addresses[id * 2]
+	
+	def __len__(self):
+		return len(self.addresses) // 2
+
+class CharacterInfo:
+	__slots__ = ("model_type", "character_number", "variation", "special_trait", "animation_number")
+	
+	def __init__(self, model_type=None, character_number=None, variation=None, special_trait=None, animation_number=None):
+		self.model_type = model_type
+		self.character_number = character_number
+		self.variation = variation
+		self.special_trait = special_trait
+		self.animation_number = animation_number
+	
+	@classmethod
+	def from_name(cls, name):
+		match = character_regex.match(name)
+		if not match:
+			return cls()
+		
+		model_type, character_number, variation, special_trait, animation_number = match.groups()
+		if animation_number != None:
+			animation_number = int(animation_number)
+		return cls(model_type, int(character_number), variation, special_trait, animation_number)
+	
+	@property
+	def key(self):
+		return (self.character_number, self.variation, self.special_trait, self.animation_number)
+
+class CharacterIndex:
+	def __init__(self, files):
+		self.by_key = {}
+		self.by_number = {}
+		# character number -> variation -> (special trait, animation number)
+		self.coverage = {}
+		self.plans = {}
+		for file in files:
+			info = file.character_info
+			if info.character_number == None:
+				continue
+			self.by_key.setdefault(info.key, []).append(file)
+			self.by_number.setdefault(info.character_number, []).append(file)
+			self.coverage.setdefault(info.character_number, {}).setdefault(info.variation, set()).add((info.special_trait, info.animation_number))
+	
+	def get(self, character_number, variation, special_trait=None, animation_number=None):
+		return self.by_key.get((character_number, variation, special_trait, animation_number), [])
+	
+	def animations(self, character_number, variation):
+		# models without a variation are used by every variation
+		variations = self.coverage.get(character_number, {})
+		return variations.get(variation, set()) | variations.get("", set())
+	
+	def plan_move(self, source_models, destination_models, fallbacks):
+		key = (tuple(source_models), tuple(destination_models), tuple((animation, tuple(substitutes)) for animation, substitutes in sorted(fallbacks.items())))
+		plan = self.plans.get(key)
+		if plan is None:
+			plan = self.plans[key] = plan_character_move(source_models, destination_models, fallbacks)
+		return plan
 
 class File:
-	def __init__(self, name, id):
+	__slots__ = ("name", "id", "table", "_character_info")
+	
+	def __init__(self, name, id, table=None):
 		self.name = name
 		self.id = id
+		self.table = table
+		self._character_info = None
 	
-	def generate_offsets(self, file, allocation_table_offset):
-		offset = self.id * 8
-		file.seek(allocation_table_offset + offset)
-		
-		self.start_address = inte(file.read(4))
-		end_address = inte(file.read(4))
-		self.length = end_address - self.start_address
+	@property
+	def start_address(self):
+		return self.table.start_address(self.id)
+	
+	@property
+	def length(self):
+		return self.table.length(self.id)
+	
+	@property
+	def character_info(self):
+		if self._character_info is None:
+			self._character_info = CharacterInfo.from_name(self.name)
+		return self._character_info
 	
 	def get_character_info(self, key):
-		match = character_regex.match(self.name)
-		
-		dictionary = {}
-		if match:
-			dictionary = match.groupdict()
-		
-		value = dictionary.get(key)
-		if value != None and key in ["character_number", "animation_number"]:
-			return int(value)
-		return value
+		return getattr(self.character_info, key, None)
 	
 	def get_path(self, path):
 		return self
@@ -217,46 +637,103 @@ class File:
 		return self.name
 
 class Directory(File):
+	__slots__ = ("offset", "first_child_id", "children", "children_by_name", "paths", "characters", "rom", "archives")
+	
+	start_address = None
+	length = None
+	
 	def __init__(self, name, id, offset, first_child_id):
 		File.__init__(self, name, id)
 		self.offset = offset
 		self.first_child_id = first_child_id
 		self.children = []
-	
-	@classmethod
-	def from_file(cls, file, id):
-		offset = inte(file.read(4))
-		first_child_id = inte(file.read(2))
-		parent_id = inte(file.read(2))
-		return Directory("", id, offset, first_child_id)
+		self.children_by_name = {}
+		self.paths = None
+		self.characters = None
+		self.rom = None
+		self.archives = {}
 	
 	def replace_file_children_with_directories(self, directories):
 		for index, child in enumerate(self.children):
-			matching_directory = [x for x in directories if x.id == child.id]
-			if matching_directory != []:
-				directories.remove(matching_directory[0])
-				matching_directory[0].name = child.name
-				self.children[index] = matching_directory[0]
-				self.children[index].replace_file_children_with_directories(directories)
-	
-	def generate_offsets(self, file, allocation_table_offset):
+			matching_directory = directories.pop(child.id, None)
+			if matching_directory is not None:
+				matching_directory.name = child.name
+				self.children[index] = matching_directory
+				matching_directory.replace_file_children_with_directories(directories)
+			self.children_by_name.setdefault(self.children[index].name, self.children[index])
+	
+	def walk(self, prefix=""):
 		for child in self.children:
-			File.generate_offsets(self, file, allocation_table_offset)
-			child.generate_offsets(file, allocation_table_offset)
+			path = prefix + child.name
+			yield path, child
+			if isinstance(child, Directory):
+				yield from child.walk(path + "/")
+	
+	def index_paths(self):
+		paths = {"": self}
+		directories = [(self, "")]
+		while directories:
+			directory, prefix = directories.pop()
+			for child in directory.children:
+				path = prefix + child.name
+				paths.setdefault(path, child)
+				if isinstance(child, Directory):
+					directories.append((child, path + "/"))
+		self.paths = paths
 	
 	def get_path(self, path):
-		next_child_name = path.split("/")[0]
-		rest_of_path = "/".join(path.split("/")[1:])
+		if self.paths is not None:
+			entry = self.paths.get(path)
+			if entry is not None:
+				return entry
 		
-		if next_child_name == "":
-			return self
+		entry = self
+		for next_child_name in path.split("/"):
+			if next_child_name == "":
+				return entry
+			if not isinstance(entry, Directory):
+				archive = self.open_archive(entry)
+				if archive is None:
+					return entry
+				entry = archive
+			
+			next_child = entry.children_by_name.get(next_child_name)
+			if next_child is None:
+				raise SwapError(f"Path not found. Failed at {next_child_name}")
+			entry = next_child
 		
-		try:
-			next_child = [x for x in self.children if x.name == next_child_name][0]
-		except:
-			error(f"Path not found. Failed at {next_child_name}")
+		return entry
+	
+	def open_archive(self, file):
+		if self.rom is None:
+			return None
+		if file not in self.archives:
+			self.archives[file] = open_narc(self.rom, file)
+		return self.archives[file]
+	
+	def find(self, pattern, regex=False):
+		expression = compile(pattern if regex else glob_to_regex(pattern))
+		if regex:
+			candidates = self.walk()
+		else:
+			prefix, recursive, _ = glob_scope(pattern)
+			candidates = self.glob_candidates(prefix, recursive)
+		
+		return [(path, file, match) for path, file in candidates if (match := expression.fullmatch(path))]
+	
+	def glob_candidates(self, prefix, recursive):
+		directory = self
+		if prefix:
+			try:
+				directory = self.get_path(prefix[:-1])
+			except SwapError:
+				return []
+			if not isinstance(directory, Directory):
+				return []
 		
-		return next_child.get_path(rest_of_path)
+		if recursive:
+			return directory.walk(prefix)
+		return ((prefix + child.name, child) for child in directory.children)
 	
 	def __repr__(self):
 		if self.name == "":
@@ -264,178 +741,867 @@ class Directory(File):
 		else:
 			return self.name + "/"
 
-def create_file_structure(nds_file):
-	with open(nds_file, "rb") as file:
-		file.seek(0x40)
-		
-		name_table_offset = inte(file.read(4))
-		name_table_length = inte(file.read(4))
-		allocation_table_offset = inte(file.read(4))
-		allocation_table_length = inte(file.read(4))
+def create_file_structure(rom):
+	name_table_offset, name_table_length, allocation_table_offset, allocation_table_length = rom.unpack("<IIII", 0x40)
+	
+	with rom.stats.phase("resolve FAT"):
+		table = FileTable(allocation_table_offset, rom.read(allocation_table_offset, allocation_table_length))
+	
+	with rom.stats.phase("parse name table"):
+		root = link_file_structure(parse_name_table(rom.map, name_table_offset, table), table)
+	return root
+
+def parse_name_table(data, name_table_offset, table):
+	offset, first_child_id, number_of_directories = unpack_from("<IHH", data, name_table_offset)
+	
+	directories = {0xF000: Directory("", 0xF000, offset, first_child_id)}
+	
+	for i in range(number_of_directories - 1):
+		id = 0xf000 + i + 1
+		offset, first_child_id, parent_id = unpack_from("<IHH", data, name_table_offset + (i + 1) * 8)
+		directories[id] = Directory("", id, offset, first_child_id)
+	
+	for directory in directories.values():
+		position = name_table_offset + directory.offset
 		
-		file.seek(name_table_offset)
+		while True:
+			file_name_length = data[position]
+			position += 1
+			if file_name_length == 0: break
+			
+			is_directory = file_name_length > 0x80
+			if is_directory:
+				file_name_length -= 0x80
+			
+			file_name = data[position:position + file_name_length].decode()
+			position += file_name_length
+			
+			if is_directory:
+				id, = unpack_from("<H", data, position)
+				position += 2
+			else:
+				id = directory.first_child_id
+				directory.first_child_id += 1
+			
+			directory.children.append(File(file_name, id, table))
+	
+	return directories
+
+# MARK: Archives
+def walk_opened_archives(root, directory=None, prefix=""):
+	# like `walk`, but also going into every archive `root.get_path` has opened so far
+	for path, file in (directory or root).walk(prefix):
+		yield path, file
+		archive = root.archives.get(file)
+		if archive is not None:
+			yield from walk_opened_archives(root, archive, path + "/")
+
+def open_narc(rom, file):
+	if file.length < 0x10 or rom.read(file.start_address, 4) != b"NARC":
+		return None
+	
+	header_size, number_of_sections = rom.unpack("<HH", file.start_address + 0xC)
+	sections = {}
+	position = header_size
+	for _ in range(number_of_sections):
+		if position + 8 > file.length:
+			raise SwapError(f"{file} is a broken NARC archive, its sections don't fit in it")
+		magic = bytes(rom.read(file.start_address + position, 4))
+		section_length, = rom.unpack("<I", file.start_address + position + 4)
+		sections[magic] = position
+		position += max(section_length, 8)
+	
+	if not all(x in sections for x in [b"BTAF", b"BTNF", b"GMIF"]):
+		raise SwapError(f"{file} is a broken NARC archive, it's missing a BTAF, BTNF, or GMIF section")
+	
+	# member addresses are relative to the start of the GMIF data, and the tables point into the ROM itself
+	allocation_table_offset = file.start_address + sections[b"BTAF"] + 12
+	number_of_files, = rom.unpack("<H", file.start_address + sections[b"BTAF"] + 8)
+	table = FileTable(allocation_table_offset, rom.read(allocation_table_offset, number_of_files * 8), file.start_address + sections[b"GMIF"] + 8)
+	
+	archive = link_file_structure(parse_name_table(rom.map, file.start_address + sections[b"BTNF"] + 8, table), table)
+	archive.name = file.name
+	archive.rom = rom
+	if not archive.children:
+		# archives without names are indexed by number
+		archive.children = [File(str(id), id, table) for id in range(number_of_files)]
+		archive.children_by_name = {x.name: x for x in archive.children}
+		archive.index_paths()
+	
+	end_of_data = file.start_address + file.length
+	for id in range(number_of_files):
+		if table.start_address(id) > table.end_address(id) or table.end_address(id) > end_of_data:
+			raise SwapError(f"{file} is a broken NARC archive, file {id} is outside of it")
+	
+	return archive
+
+def link_file_structure(directories, table, characters=None):
+	root = directories.pop(0xF000)
+	root.table = table
+	root.replace_file_children_with_directories(directories)
+	root.index_paths()
+	
+	character_models = root.paths.get("model/fieldchar")
+	if isinstance(character_models, Directory):
+		if characters:
+			for child in character_models.children:
+				child._character_info = characters.get(child.id)
+		root.characters = CharacterIndex(character_models.children)
+	
+	return root
+
+# MARK: Index cache
+INDEX_CACHE_VERSION = 2
+
+def rom_fingerprint(rom, full_hash=False):
+	status = os.stat(rom.file.fileno())
+	header_checksum, = rom.unpack("<H", 0x15E)
+	rom_hash = blake2b(rom.view).hexdigest() if full_hash else None
+	return (status.st_size, status.st_mtime_ns, header_checksum, rom_hash)
+
+def save_file_structure(root, cache_file, fingerprint):
+	directories = [root] + [x for _, x in root.walk() if isinstance(x, Directory)]
+	serialized_directories = []
+	for x in directories:
+		child_ids = array("H", [child.id for child in x.children])
+		if byteorder == "big":
+			child_ids.byteswap()
+		serialized_directories.append((x.id, x.offset, x.first_child_id, "/".join(child.name for child in x.children), child_ids.tobytes()))
+	
+	serialized_characters = []
+	if root.characters is not None:
+		for models in root.characters.by_number.values():
+			for x in models:
+				info = x.character_info
+				serialized_characters.append((x.id, info.model_type, info.character_number, info.variation, info.special_trait, info.animation_number))
+	
+	addresses = array("I", root.table.addresses)
+	if byteorder == "big":
+		addresses.byteswap()
+	
+	data = (INDEX_CACHE_VERSION, fingerprint, root.table.offset, addresses.tobytes(), serialized_directories, serialized_characters)
+	try:
+		with open(cache_file, "wb") as file:
+			file.write(b"FF1I" + bytes([marshal.version]) + marshal.dumps(data))
+	except OSError:
+		pass
+
+def load_file_structure(cache_file, fingerprint):
+	try:
+		with open(cache_file, "rb") as file:
+			cache = file.read()
+		if cache[:5] != b"FF1I" + bytes([marshal.version]):
+			return None
+		version, cached_fingerprint, table_offset, table_data, serialized_directories, serialized_characters = marshal.loads(cache[5:])
+	except (OSError, EOFError, ValueError, TypeError):
+		return None
+	
+	if version != INDEX_CACHE_VERSION or cached_fingerprint[:3] != fingerprint[:3]:
+		return None
+	if fingerprint[3] is not None and cached_fingerprint[3] != fingerprint[3]:
+		return None
+	
+	table = FileTable(table_offset, table_data)
+	
+	characters = {x[0]: CharacterInfo(*x[1:]) for x in serialized_characters}
+	directories = {}
+	for id, offset, first_child_id, names, child_ids in serialized_directories:
+		directory = Directory("", id, offset, first_child_id)
+		child_ids = array("H", child_ids)
+		if byteorder == "big":
+			child_ids.byteswap()
+		if names:
+			directory.children = [File(name, child_id, table) for name, child_id in zip(names.split("/"), child_ids)]
+		directories[id] = directory
+	
+	return link_file_structure(directories, table, characters)
+
+def cached_file_structure(rom, full_hash=False):
+	cache_file = f"{rom.path}.index"
+	fingerprint = rom_fingerprint(rom, full_hash)
+	
+	with rom.stats.phase("read index cache"):
+		root = load_file_structure(cache_file, fingerprint)
+	if root is None:
+		root = create_file_structure(rom)
+		with rom.stats.phase("write index cache"):
+			save_file_structure(root, cache_file, fingerprint)
+	return root
+
+def merge_writes(writes):
+	merged = []
+	for offset, data in sorted(writes, key=lambda write: write[0]):
+		if merged and merged[-1][0] + len(merged[-1][1]) == offset:
+			merged[-1] = (merged[-1][0], merged[-1][1] + data)
+		else:
+			merged.append((offset, bytes(data)))
+	return merged
+
+# MARK: Content hashes
+class ContentIndex:
+	def __init__(self, rom, workers=None):
+		self.rom = rom
+		self.files = [(path, file) for path, file in rom.root.walk() if not isinstance(file, Directory)]
+		self.digests = hash_regions_in_parallel(rom, {(file.start_address, file.length) for _, file in self.files}, workers)
+	
+	def digest(self, file):
+		region = (file.start_address, file.length)
+		digest = self.digests.get(region)
+		if digest is None:
+			# archive members aren't part of the walk, so they're hashed when they're first needed
+			digest = self.digests[region] = hash_regions(self.rom, [region])[region]
+		return digest
+	
+	def same_content(self, file1, file2):
+		return file1.length == file2.length and self.digest(file1) == self.digest(file2)
+	
+	def duplicates(self):
+		groups = {}
+		for path, file in self.files:
+			if file.length > 0:
+				groups.setdefault((file.length, self.digest(file)), []).append((path, file))
 		
-		offset = inte(file.read(4))
-		first_child_id = inte(file.read(2))
-		number_of_directories = inte(file.read(2))
+		groups = [group for group in groups.values() if len(group) > 1]
+		groups.sort(key=lambda group: group[0][1].length * (len(group) - 1), reverse=True)
+		return groups
+
+def hash_regions(rom, regions):
+	return {
+		(offset, length): blake2b(rom.read(offset, length), digest_size=16).digest()
+		for offset, length in regions
+	}
+
+def hash_regions_in_parallel(rom, regions, workers=None, batches_per_worker=4):
+	regions = sorted(regions)
+	workers = workers or os.cpu_count() or 1
+	batch_size = max(1, -(-len(regions) // (workers * batches_per_worker)))
+	batches = [regions[i:i + batch_size] for i in range(0, len(regions), batch_size)]
+	
+	digests = {}
+	with ThreadPoolExecutor(workers) as executor:
+		for batch_digests in executor.map(lambda batch: hash_regions(rom, batch), batches):
+			digests.update(batch_digests)
+	return digests
+
+# MARK: Copying
+def clone_file(source_path, destination_path):
+	if ioctl is not None:
+		try:
+			with open(source_path, "rb") as source_file, open(destination_path, "wb") as destination_file:
+				ioctl(destination_file.fileno(), FICLONE, source_file.fileno())
+			return True
+		except OSError:
+			pass
+	
+	copyfile(source_path, destination_path)
+	return False
+
+class RangeCopier:
+	CHUNK_SIZE = 0x100000
+	BUFFER_COUNT = 4
+	
+	def __init__(self, input_rom, output_file, stats):
+		self.input_rom = input_rom
+		self.output_file = output_file
+		self.stats = stats
+		self.position = None
 		
-		directories = [Directory("", 0xF000, offset, first_child_id)]
+		if hasattr(os, "copy_file_range"):
+			self.method = "copy_file_range"
+		elif hasattr(os, "sendfile"):
+			self.method = "sendfile"
+		else:
+			self.method = "buffered"
+	
+	def copy(self, writes):
+		ranges = []
+		for offset, length, source_offset, data in writes:
+			if data is None:
+				ranges.append((offset, source_offset, length))
+			else:
+				self.write(offset, data)
 		
-		for i in range(number_of_directories - 1):
-			id = 0xf000 + i + 1
-			directories.append(Directory.from_file(file, id))
+		if ranges:
+			self.copy_ranges(ranges)
+	
+	def write(self, offset, data):
+		if offset != self.position:
+			self.output_file.seek(offset)
+			self.stats.count("seeks")
+		self.output_file.write(data)
+		self.position = offset + len(data)
+		self.stats.count("writes")
+		self.stats.count("bytes_written", len(data))
+	
+	def copy_ranges(self, ranges):
+		self.output_file.flush()
 		
-		for directory in directories:
-			file.seek(name_table_offset + directory.offset)
+		index = 0
+		while index < len(ranges) and self.method != "buffered":
+			destination_offset, source_offset, length = ranges[index]
+			try:
+				copied = self.copy_in_kernel(destination_offset, source_offset, length)
+			except OSError:
+				# not supported between these files, so try the next method for what's left
+				self.method = "sendfile" if self.method == "copy_file_range" and hasattr(os, "sendfile") else "buffered"
+				continue
 			
-			while True:
-				file_name_length = inte(file.read(1))
-				if file_name_length == 0: break
-				
-				is_directory = file_name_length > 0x80
-				if is_directory:
-					file_name_length -= 0x80
-				
-				file_name = file.read(file_name_length).decode()
+			if copied == 0:
+				raise SwapError("Unexpected end of input ROM")
+			self.stats.count("writes")
+			self.stats.count("bytes_read", copied)
+			self.stats.count("bytes_written", copied)
+			
+			if copied < length:
+				ranges[index] = (destination_offset + copied, source_offset + copied, length - copied)
+			else:
+				index += 1
+		
+		if index < len(ranges):
+			self.copy_buffered(ranges[index:])
+	
+	def copy_in_kernel(self, destination_offset, source_offset, length):
+		input_descriptor = self.input_rom.file.fileno()
+		output_descriptor = self.output_file.fileno()
+		
+		if self.method == "copy_file_range":
+			return os.copy_file_range(input_descriptor, output_descriptor, length, source_offset, destination_offset)
+		
+		if destination_offset != self.position:
+			os.lseek(output_descriptor, destination_offset, os.SEEK_SET)
+			self.stats.count("seeks")
+		copied = os.sendfile(output_descriptor, input_descriptor, source_offset, length)
+		self.position = destination_offset + copied
+		return copied
+	
+	def copy_buffered(self, ranges):
+		free_buffers = Queue()
+		for _ in range(self.BUFFER_COUNT):
+			free_buffers.put(bytearray(self.CHUNK_SIZE))
+		filled_buffers = Queue()
+		
+		def read_ranges():
+			try:
+				for destination_offset, source_offset, length in ranges:
+					for start in range(0, length, self.CHUNK_SIZE):
+						buffer = free_buffers.get()
+						if buffer is None:
+							return
+						
+						size = min(self.CHUNK_SIZE, length - start)
+						# reading through the map leaves the file position alone, which forked batch workers share
+						if source_offset + start + size > len(self.input_rom.map):
+							raise SwapError("Unexpected end of input ROM")
+						buffer[:size] = self.input_rom.view[source_offset + start:source_offset + start + size]
+						filled_buffers.put((destination_offset + start, size, buffer))
+			except Exception as exception:
+				filled_buffers.put(exception)
+			else:
+				filled_buffers.put(None)
+		
+		reader = Thread(target=read_ranges, daemon=True)
+		reader.start()
+		
+		# the reader fills the next buffers while this one is written
+		self.position = None
+		try:
+			while (item := filled_buffers.get()) is not None:
+				if isinstance(item, Exception):
+					raise item
 				
-				if is_directory:
-					id = inte(file.read(2))
-				else:
-					id = directory.first_child_id
-					directory.first_child_id += 1
+				offset, size, buffer = item
+				with memoryview(buffer)[:size] as view:
+					self.write(offset, view)
+				self.stats.count("bytes_read", size)
+				free_buffers.put(buffer)
+		except BaseException:
+			free_buffers.put(None)
+			raise
+		finally:
+			reader.join()
+
+class MovePlan:
+	def __init__(self, pointer_mode=False, debug=False, content_index=None, model_rom=None):
+		self.pointer_mode = pointer_mode
+		self.model_rom = model_rom
+		self.debug = debug
+		self.content_index = content_index
+		self.moves = {}
+		self.written = set()
+		self.skipped = 0
+		self.origin = None
+		self.origins = {}
+		self.conflicts = []
+		self.dead_writes = 0
+		self.remapped = {}
+		self.patched = {}
+	
+	def add(self, source, destination):
+		if self.pointer_mode:
+			if source.table is not destination.table:
+				raise SwapError(f"{source} and {destination} aren't in the same file table, so their pointers can't be swapped")
+		elif self.model_rom is not None:
+			# remapping up front means a broken model stops the run before anything is written
+			if source is not destination:
+				self.remapped[destination] = remap_model(self.model_rom, source, destination)
+		elif source.length != destination.length:
+			raise SwapError(f"{source} and {destination}'s sizes differ ({source.length} != {destination.length})")
+		
+		# a destination that was already written needs restoring, even if it started out identical
+		if self.content_index and destination not in self.written and self.content_index.same_content(source, destination):
+			if self.debug:
+				print(f"Skipping {source} -> {destination}, their contents are identical")
+			self.moves.pop(destination, None)
+			self.skipped += 1
+			return
+		
+		if destination in self.moves:
+			self.dead_writes += 1
+			previous_source = self.moves[destination]
+			if previous_source is not source:
+				self.conflicts.append((destination, previous_source, self.origins[destination], source, self.origin))
+		
+		if source is destination and destination not in self.written:
+			self.moves.pop(destination, None)
+			return
+		
+		self.moves[destination] = source
+		self.origins[destination] = self.origin
+	
+	def regions(self, moves=None):
+		moves = sorted(
+			(destination.start_address, source.start_address, source.length)
+			for destination, source in (self.moves if moves is None else moves).items() if source.length > 0
+		)
+		
+		regions = []
+		for destination_offset, source_offset, length in moves:
+			if regions:
+				last_destination_offset, last_source_offset, last_length = regions[-1]
+				# files can share data, so a range that's already being written is left to the first move that writes it
+				overlap = last_destination_offset + last_length - destination_offset
+				if overlap >= length:
+					continue
+				if overlap > 0:
+					destination_offset += overlap
+					source_offset += overlap
+					length -= overlap
 				
-				directory.children.append(File(file_name, id))
+				if last_destination_offset + last_length == destination_offset and last_source_offset + last_length == source_offset:
+					regions[-1] = (last_destination_offset, last_source_offset, last_length + length)
+					continue
+			regions.append((destination_offset, source_offset, length))
+		return regions
+	
+	def table_entries(self, moves=None):
+		return merge_writes(
+			(destination.table.entry_offset(destination.id), destination.table.pack_entry(source.start_address, source.length))
+			for destination, source in (self.moves if moves is None else moves).items()
+		)
+	
+	def writes(self, moves=None):
+		if self.pointer_mode:
+			return [(offset, len(data), None, data) for offset, data in self.table_entries(moves)]
+		else:
+			return [(destination_offset, length, source_offset, None) for destination_offset, source_offset, length in self.regions(moves)]
+	
+	def journal_entries(self, input_rom):
+		if self.pointer_mode:
+			return {
+				destination: (destination.table.entry_offset(destination.id), 8, blake2b(destination.table.pack_entry(source.start_address, source.length), digest_size=16).digest())
+				for destination, source in self.moves.items()
+			}
+		else:
+			return {
+				destination: (destination.start_address, source.length, blake2b(input_rom.contents(source), digest_size=16).digest())
+				for destination, source in self.moves.items() if source.length > 0
+			}
+	
+	def write(self, input_rom, output_nds_file, stats, journal=None, restore=False):
+		moves = self.moves
+		entries = {}
+		restores = []
+		if journal is not None:
+			entries = self.journal_entries(input_rom)
+			new_ranges = {(offset, length) for offset, length, _ in entries.values()}
+			if restore:
+				restores = [(offset, length, offset, None) for offset, length in journal.ranges() - new_ranges]
+				journal.remove(restores)
+			
+			moves = {destination: source for destination, source in moves.items() if destination in entries and not journal.contains(entries[destination])}
+			journal.add(entries.values())
+		
+		writes = self.writes(moves)
+		if self.debug:
+			print(f"Writing {len(moves)} moves as {len(writes)} regions")
+			if journal is not None:
+				print(f"Journal: {len(self.moves) - len(moves)} moves already written, {len(restores)} ranges restored from the input")
+		stats.count("moves", len(moves))
+		stats.count("skipped_moves", self.skipped + len(self.moves) - len(moves))
+		
+		stats.count("opens")
+		with open(output_nds_file, "r+b") as output_file:
+			copier = RangeCopier(input_rom, output_file, stats)
+			# restores go first, in case a range that's being restored overlaps a new one
+			copier.copy(sorted(restores))
+			copier.copy(writes)
+			if self.debug:
+				print(f"Copied using {copier.method}")
+		
+		self.written.update(self.moves)
+		self.moves.clear()
+		self.origins.clear()
+		self.skipped = 0
+		return entries, restores
+	
+	def write_models(self, repacker, output_nds_file, stats):
+		for destination in self.moves:
+			repacker.replace(destination, self.remapped[destination])
+		if self.debug:
+			print(f"Writing {len(self.moves)} remapped models, {len(repacker.replacements)} in total")
+		stats.count("moves", len(self.moves))
+		stats.count("skipped_moves", self.skipped)
+		
+		# every write starts over from a fresh copy, so models swapped earlier are written again
+		repacker.write(output_nds_file, stats)
+		
+		self.written.update(self.moves)
+		self.moves.clear()
+		self.origins.clear()
+		self.remapped.clear()
+		self.skipped = 0
+	
+	def write_patch(self, input_rom, patch_file, patch_format, stats):
+		# each patch replaces the last one, so it has to include every move written before it
+		self.patched.update(self.moves)
+		writes = self.writes(self.patched)
+		if self.debug:
+			print(f"Writing {len(self.patched)} moves as {len(writes)} {patch_format.upper()} regions")
+		stats.count("moves", len(self.moves))
+		stats.count("skipped_moves", self.skipped)
 		
-		root = directories.pop(0)
-		root.replace_file_children_with_directories(directories)
-		root.generate_offsets(file, allocation_table_offset)
+		if patch_format == "ips":
+			write_ips(patch_file, input_rom, writes)
+		else:
+			write_bps(patch_file, input_rom, writes)
 		
-		return root
+		stats.count("opens")
+		stats.count("writes")
+		stats.count("bytes_written", getsize(patch_file))
+		self.written.update(self.moves)
+		self.moves.clear()
+		self.origins.clear()
+		self.skipped = 0
 
-def move_path(path1, path2):
-	return move(root.get_path(path1), root.get_path(path2))
+# MARK: Journals
+JOURNAL_VERSION = 1
 
-def move(source, destination):
-	if source.length != destination.length:
-		error(f"{source} and {destination}'s sizes differ ({source.length} != {destination.length})")
+class Journal:
+	def __init__(self, output_nds_file, input_fingerprint):
+		self.path = f"{output_nds_file}.journal"
+		self.output_nds_file = output_nds_file
+		self.input_fingerprint = input_fingerprint
+		self.entries = {}
 	
-	with open(input_nds_file, "rb") as input_file:
-		input_file.seek(source.start_address)
-		with open(output_nds_file, "r+b") as output_file:
-			output_file.seek(destination.start_address)
-			output_file.write(input_file.read(source.length))
+	@classmethod
+	def load(cls, output_nds_file, input_fingerprint):
+		journal = cls(output_nds_file, input_fingerprint)
+		try:
+			with open(journal.path, "rb") as file:
+				data = file.read()
+			if data[:5] != b"FF1J" + bytes([marshal.version]):
+				return None
+			version, cached_input_fingerprint, output_fingerprint, entries = marshal.loads(data[5:])
+			status = os.stat(output_nds_file)
+		except (OSError, EOFError, ValueError, TypeError):
+			return None
+		
+		# the output has to be exactly what was written last time, from the same input
+		if version != JOURNAL_VERSION or cached_input_fingerprint != input_fingerprint:
+			return None
+		if output_fingerprint != (status.st_size, status.st_mtime_ns):
+			return None
+		
+		journal.entries = {(offset, length): digest for offset, length, digest in entries}
+		return journal
+	
+	def save(self):
+		status = os.stat(self.output_nds_file)
+		entries = [(offset, length, digest) for (offset, length), digest in self.entries.items()]
+		data = (JOURNAL_VERSION, self.input_fingerprint, (status.st_size, status.st_mtime_ns), entries)
+		try:
+			with open(self.path, "wb") as file:
+				file.write(b"FF1J" + bytes([marshal.version]) + marshal.dumps(data))
+		except OSError:
+			pass
+	
+	def ranges(self):
+		return set(self.entries)
+	
+	def contains(self, entry):
+		offset, length, digest = entry
+		return self.entries.get((offset, length)) == digest
+	
+	def add(self, entries):
+		for offset, length, digest in entries:
+			self.entries[(offset, length)] = digest
+	
+	def remove(self, writes):
+		for offset, length, _, _ in writes:
+			self.entries.pop((offset, length), None)
 
-def swap_path(path1, path2):
-	return swap(root.get_path(path1), root.get_path(path2))
+def remove_journal(output_nds_file):
+	try:
+		os.remove(f"{output_nds_file}.journal")
+	except OSError:
+		pass
 
-def swap(source, destination):
-	move(source, destination),
-	move(destination, source)
+# MARK: Verification
+def crc16(data):
+	crc = 0xFFFF
+	for byte in data:
+		crc ^= byte
+		for _ in range(8):
+			crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+	return crc
 
-def get_character(root, character_number, variation):
-	character_model_files = root.get_path("model/fieldchar").children
-	if variation:
-		return [x for x in character_model_files if x.get_character_info("character_number") == character_number and x.get_character_info("variation") in [variation, ""]]
-	else:
-		return [x for x in character_model_files if x.get_character_info("character_number") == character_number]
+def verify_output(input_rom, output_nds_file, expected, restored=(), workers=None, size=None):
+	try:
+		output_rom = Rom(output_nds_file, cache=False)
+	except (OSError, ValueError) as exception:
+		raise SwapError(f"Couldn't open '{output_nds_file}' to verify it: {exception}")
+	
+	try:
+		header_checksum, = output_rom.unpack("<H", 0x15E)
+		results = [
+			("header checksum", crc16(output_rom.read(0, 0x15E)) == header_checksum),
+			("ROM size", len(output_rom.map) == (size or len(input_rom.map))),
+		]
+		
+		# restored ranges should match the input, everything else the hash of what was written
+		output_digests = hash_regions_in_parallel(output_rom, set(expected) | set(restored), workers)
+		input_digests = hash_regions_in_parallel(input_rom, restored, workers)
+		
+		for region, (label, digest) in sorted(expected.items()):
+			results.append((label, output_digests[region] == digest))
+		for region in sorted(restored):
+			results.append((f"restored 0x{region[0]:X}", output_digests[region] == input_digests[region]))
+	finally:
+		output_rom.close()
+	return results
+
+# MARK: Patches
+def write_ips(patch_file, input_rom, writes):
+	# the patch is built before the file is opened, so a write that doesn't fit leaves the last patch as it was
+	patch = bytearray(b"PATCH")
+	last_end = None
+	last_byte = None
+	for offset, length, source_offset, data in writes:
+		if offset + length > 0x1000000:
+			raise SwapError("IPS patches can't change anything past 16 MB, use a BPS patch instead")
+		if data is None:
+			data = input_rom.read(source_offset, length)
+		data = bytes(data)
+		
+		position = 0
+		while position < len(data):
+			record_offset = offset + position
+			# a record at "EOF" would end the patch, so it starts a byte early, repeating that byte's new value
+			prefix = b""
+			if record_offset == 0x454F46:
+				prefix = last_byte if last_end == record_offset else bytes(input_rom.read(record_offset - 1, 1))
+				record_offset -= 1
+			
+			record = prefix + data[position:position + 0xFFFF - len(prefix)]
+			position += len(record) - len(prefix)
+			patch += record_offset.to_bytes(3, "big")
+			patch += len(record).to_bytes(2, "big")
+			patch += record
+			last_end = record_offset + len(record)
+			last_byte = record[-1:]
+	patch += b"EOF"
+	
+	with open(patch_file, "wb") as file:
+		file.write(patch)
+
+def apply_ips(patch, output_file):
+	position = 5
+	while patch[position:position + 3] != b"EOF":
+		offset = int.from_bytes(patch[position:position + 3], "big")
+		length = int.from_bytes(patch[position + 3:position + 5], "big")
+		position += 5
+		
+		output_file.seek(offset)
+		if length == 0:
+			length = int.from_bytes(patch[position:position + 2], "big")
+			output_file.write(patch[position + 2:position + 3] * length)
+			position += 3
+		else:
+			output_file.write(patch[position:position + length])
+			position += length
+	
+	if len(patch) == position + 6:
+		output_file.truncate(int.from_bytes(patch[position + 3:position + 6], "big"))
+
+def encode_number(number):
+	encoded = bytearray()
+	while True:
+		x = number & 0x7F
+		number >>= 7
+		if number == 0:
+			encoded.append(0x80 | x)
+			return encoded
+		encoded.append(x)
+		number -= 1
 
-def swap_characters(source_models, destination_models):
-	move_character(source_models, destination_models) 
-	move_character(destination_models, source_models)
+def decode_number(data, position):
+	number = 0
+	shift = 1
+	while True:
+		x = data[position]
+		position += 1
+		number += (x & 0x7F) * shift
+		if x & 0x80:
+			return number, position
+		shift <<= 7
+		number += shift
+
+def write_bps(patch_file, input_rom, writes):
+	size = len(input_rom.map)
+	source_checksum = crc32(input_rom.view)
+	target_checksum = 0
+	
+	patch = bytearray(b"BPS1")
+	patch += encode_number(size)
+	patch += encode_number(size)
+	patch += encode_number(0)
+	
+	def source_read(length):
+		nonlocal target_checksum
+		if length > 0:
+			patch.extend(encode_number((length - 1) << 2 | 0))
+			target_checksum = crc32(input_rom.read(position, length), target_checksum)
+	
+	position = 0
+	source_position = 0
+	for offset, length, source_offset, data in writes:
+		# actions can't go backwards, so anything already written is skipped
+		if offset < position:
+			skipped = min(position - offset, length)
+			offset += skipped
+			length -= skipped
+			if data is None:
+				source_offset += skipped
+			else:
+				data = data[skipped:]
+			if length == 0:
+				continue
+		source_read(offset - position)
+		
+		if data is None:
+			relative_offset = source_offset - source_position
+			patch += encode_number((length - 1) << 2 | 2)
+			patch += encode_number(abs(relative_offset) << 1 | (relative_offset < 0))
+			source_position = source_offset + length
+			target_checksum = crc32(input_rom.read(source_offset, length), target_checksum)
+		else:
+			patch += encode_number((length - 1) << 2 | 1)
+			patch += data
+			target_checksum = crc32(data, target_checksum)
+		
+		position = offset + length
+	source_read(size - position)
+	
+	patch += pack("<II", source_checksum, target_checksum)
+	patch += pack("<I", crc32(patch))
+	
+	with open(patch_file, "wb") as file:
+		file.write(patch)
 
-def move_character(source_models, destination_models):
-	for source_model in source_models:
-		special_trait = source_model.get_character_info("special_trait")
-		animation_number = source_model.get_character_info("animation_number")
+def apply_bps(patch, input_rom, output_file):
+	if crc32(patch[:-4]) != unpack_from("<I", patch, len(patch) - 4)[0]:
+		raise SwapError("Patch is corrupted, its checksum doesn't match")
+	
+	source_checksum, target_checksum = unpack_from("<II", patch, len(patch) - 12)
+	if crc32(input_rom.view) != source_checksum:
+		raise SwapError(f"Patch wasn't made for '{input_rom.path}', its checksum doesn't match")
+	
+	source_size, position = decode_number(patch, 4)
+	target_size, position = decode_number(patch, position)
+	metadata_size, position = decode_number(patch, position)
+	position += metadata_size
+	
+	output_position = 0
+	source_position = 0
+	target_position = 0
+	while position < len(patch) - 12:
+		action, position = decode_number(patch, position)
+		length = (action >> 2) + 1
+		action &= 3
 		
-		matching_destinations = [x for x in destination_models if x.get_character_info("special_trait") == special_trait and x.get_character_info("animation_number") == animation_number]
+		if action == 0:
+			if output_position + length > len(input_rom.map):
+				raise SwapError("Patch reads past the end of the input ROM")
+		elif action == 1:
+			output_file.seek(output_position)
+			output_file.write(patch[position:position + length])
+			position += length
+		else:
+			relative_offset, position = decode_number(patch, position)
+			relative_offset = -(relative_offset >> 1) if relative_offset & 1 else relative_offset >> 1
+			output_file.seek(output_position)
+			
+			if action == 2:
+				source_position += relative_offset
+				output_file.write(input_rom.read(source_position, length))
+				source_position += length
+			else:
+				target_position += relative_offset
+				for start in range(0, length, output_position - target_position):
+					output_file.seek(target_position + start)
+					data = output_file.read(min(length - start, output_position - target_position))
+					output_file.seek(output_position + start)
+					output_file.write(data)
+				target_position += length
 		
-		for destination in matching_destinations:
-			if DEBUG:
-				print(source_model, destination)
-			move(source_model, destination)
+		output_position += length
 	
-	if not [x for x in source_models if x.get_character_info("animation_number") == 3] and ADD_WEIRD_SPRINT:
-		walking_model = [x for x in source_models if x.get_character_info("animation_number") == 2]
-		if walking_model:
-			walking_model = walking_model[0]
+	output_file.truncate(target_size)
+	output_file.seek(0)
+	checksum = 0
+	while data := output_file.read(0x100000):
+		checksum = crc32(data, checksum)
+	if checksum != target_checksum:
+		raise SwapError("Patched ROM doesn't match the patch's checksum")
+
+def apply_patch(patch_file, input_nds_file, output_nds_file):
+	with open(patch_file, "rb") as file:
+		patch = file.read()
+	
+	if not (patch.startswith(b"PATCH") or patch.startswith(b"BPS1")):
+		raise SwapError(f"Unknown patch format: '{patch_file}'")
+	
+	clone_file(input_nds_file, output_nds_file)
+	with open(output_nds_file, "r+b") as output_file:
+		if patch.startswith(b"PATCH"):
+			apply_ips(patch, output_file)
 		else:
-			error("Cannot add weird sprint, no walking animation found. Please disable ADD_WEIRD_SPRINT by adding the flag --disable-weird-sprint")
-				
-		running_destinations = [x for x in destination_models if x.get_character_info("animation_number") == 3]
-		
-		for destination in running_destinations:
-			if DEBUG:
-				print("ADD_WEIRD_SPRINT: ", end="")
-				print(walking_model, destination)
-			move(walking_model, destination)
-
-# MARK: DEBUG
-DEBUG = len(argv) > 1 and argv[1].lower() == "debug"
-if DEBUG:
-	argv.pop(1)
-	print("debug mode enabled")
-
-# MARK: CUSTOM_MODE
-CUSTOM_MODE = len(argv) > 1 and argv[1].lower() == "custom"
-if CUSTOM_MODE:
-	argv.pop(1)
-	print("custom mode enabled")
-
-# MARK: ADD_WEIRD_SPRINT
-ADD_WEIRD_SPRINT = not (len(argv) > 1 and argv[1].lower() in ["-d", "--disable-weird-sprint"])
-if not ADD_WEIRD_SPRINT:
-	argv.pop(1)
-	print("Disabling ADD_WEIRD_SPRINT")
-
-# MARK: input_nds_file
-if len(argv) > 1:
-	input_nds_file = argv.pop(1)
-	
-	if not isfile(input_nds_file):
-		error(f"Input file does not exist: '{input_nds_file}'")
-else:
-	nds_files = sorted(glob("*.nds"))
-	
-	if len(nds_files) == 0:
-		error("No nds files found in current directory")
-	elif len(nds_files) == 1:
-		input_nds_file = nds_files[0]
-	else:
-		print("Found nds files:")
-		for index, file_name in enumerate(nds_files):
-			print(f"    [{index}] - {file_name}")
+			input_rom = Rom(input_nds_file)
+			apply_bps(patch, input_rom, output_file)
+			input_rom.close()
 
-		try:
-			input_nds_file_index = int(input("Pick an nds file as input: "))
-			assert(input_nds_file_index >= 0)
-			input_nds_file = nds_files[input_nds_file_index]
-		except:
-			error("Invalid index")
-
-print(f"Using '{input_nds_file}' as input file", end="\n\n")
-
-# MARK: output_nds_file
-if len(argv) > 1:
-	output_name = argv.pop(1)
-	output_nds_file = f"{input_nds_file[:-4]} - {output_name}.nds"
-else:
-	output_name = input("Pick a name for the output file (ex: Rosie mod): ")
-	output_nds_file = f"{input_nds_file[:-4]} - {output_name}.nds"
-
-	if isfile(output_nds_file):
-		overwrite = input(f"File '{output_nds_file}' already exists, do you want to overwrite it [y/N]? ")
-		if not overwrite.lower().startswith("y"):
-			error("Aborting...")
-
-print(f"Using '{output_nds_file}' as output file", end="\n\n")
-
-if not CUSTOM_MODE:
-	if len(argv) > 1:
-		character_number = argv.pop(1)
-	else:
-		character_number = input("Which character would you like to swap with Hunter? ")
+def get_character(root, character_number, variation):
+	characters = root.characters
+	if characters is None:
+		characters = CharacterIndex(root.get_path("model/fieldchar").children)
 	
+	character_model_files = characters.by_number.get(character_number, [])
+	if variation:
+		return [x for x in character_model_files if x.character_info.variation in [variation, ""]]
+	else:
+		return list(character_model_files)
+
+def parse_character(character_number):
 	character_variation = "a"
 	if not character_number.isdigit() and len(character_number) > 0:
 		character_variation = character_number[-1]
@@ -444,50 +1610,1207 @@ if not CUSTOM_MODE:
 	try:
 		character_number = int(character_number)
 	except:
-		error(f"Invalid character id: {character_number}{character_variation}, expected an integer")
+		raise SwapError(f"Invalid character id: {character_number}{character_variation}, expected an integer")
 	
 	if character_number < 0 or character_number > 47:
-		error(f"Invalid character id: {character_number}, must be within range [0, 47]")
+		raise SwapError(f"Invalid character id: {character_number}, must be within range [0, 47]")
 	
-	print(f"Swapping Hunter with character {character_number}{character_variation}")
+	return character_number, character_variation
 
-root = create_file_structure(input_nds_file)
-copyfile(input_nds_file, output_nds_file)
+# MARK: Character plans
+# animation number -> animations to use instead when the source doesn't have it
+ANIMATION_FALLBACKS = {3: [2]}
 
-# ╭──────────────────────────────────────────────────────────────────────────╮
-# │ Commands                                                                 │
-# ├──────────────────────────────────────────────────────────────────────────┤
-# │ root                                                                     │
-# │     An object representing the root directory of the ROM.                │
-# │     This is created above with `create_file_structure`.                  │
-# │                                                                          │
-# │ root.get_path(path)                                                      │
-# │     Given a file path, returns the file object at that path.             │
-# │     Panics if an invalid path is provided.                               │
-# │                                                                          │
-# │ move(source, destination)                                                │
+def plan_character_move(source_models, destination_models, fallbacks):
+	sources_by_animation = {}
+	for source in source_models:
+		info = source.character_info
+		sources_by_animation.setdefault((info.special_trait, info.animation_number), []).append(source)
+	
+	destinations_by_animation = {}
+	for destination in destination_models:
+		info = destination.character_info
+		destinations_by_animation.setdefault((info.special_trait, info.animation_number), []).append(destination)
+	
+	moves = []
+	for source in source_models:
+		info = source.character_info
+		for destination in destinations_by_animation.get((info.special_trait, info.animation_number), []):
+			moves.append((source, destination, False))
+	
+	# the first source with each animation, whatever its special trait, like the original weird sprint
+	first_by_animation = {}
+	for source in source_models:
+		first_by_animation.setdefault(source.character_info.animation_number, source)
+	
+	gaps = []
+	missing = []
+	for destination in destination_models:
+		info = destination.character_info
+		if (info.special_trait, info.animation_number) in sources_by_animation:
+			continue
+		
+		if info.animation_number not in fallbacks:
+			gaps.append(destination)
+			continue
+		
+		substitute = next((sources_by_animation[(info.special_trait, x)][0] for x in fallbacks[info.animation_number] if (info.special_trait, x) in sources_by_animation), None)
+		if substitute is None and info.animation_number not in first_by_animation:
+			substitute = next((first_by_animation[x] for x in fallbacks[info.animation_number] if x in first_by_animation), None)
+		
+		if substitute is not None:
+			moves.append((substitute, destination, True))
+		elif info.animation_number in first_by_animation:
+			# the source has this animation with another special trait, so the destination is left as it is
+			gaps.append(destination)
+		else:
+			missing.append(destination)
+	
+	return moves, gaps, missing
+
+def animation_label(special_trait, animation_number):
+	if animation_number is None:
+		return special_trait or "head"
+	return f"{special_trait}_{animation_number:02}" if special_trait else f"{animation_number:02}"
+
+def describe_coverage(characters, fallbacks, reference=(1, "a")):
+	reference_animations = characters.animations(*reference)
+	
+	lines = []
+	for character_number in sorted(characters.coverage):
+		variations = sorted(characters.coverage[character_number])
+		if len(variations) > 1 and "" in variations:
+			variations.remove("")
+		
+		for variation in variations:
+			animations = characters.animations(character_number, variation)
+			filled = []
+			missing = []
+			for special_trait, animation_number in sorted(reference_animations - animations, key=lambda key: (key[0] or "", key[1] or 0)):
+				label = animation_label(special_trait, animation_number)
+				substitute = next(((special_trait, x) for x in fallbacks.get(animation_number, []) if (special_trait, x) in animations), None)
+				if substitute is None and animation_number not in {x for _, x in animations}:
+					substitute = next(((trait, x) for x in fallbacks.get(animation_number, []) for trait, y in sorted(animations, key=lambda key: key[0] or "") if x == y), None)
+				if substitute is None:
+					missing.append(label)
+				else:
+					filled.append(f"{label} (from {animation_label(*substitute)})")
+			
+			line = f"{character_number}{variation}: {len(animations)} models"
+			if filled:
+				line += f", filled in: {', '.join(filled)}"
+			if missing:
+				line += f", missing: {', '.join(missing)}"
+			lines.append(line)
+	return "\n".join(lines)
+
+
+# MARK: Queries
+def glob_to_regex(pattern):
+	# like fnmatch, but wildcards don't cross directories (except "**"), and each one is a group
+	parts = []
+	index = 0
+	while index < len(pattern):
+		character = pattern[index]
+		if pattern.startswith("**", index):
+			parts.append("(.*)")
+			index += 1
+		elif character == "*":
+			parts.append("([^/]*)")
+		elif character == "?":
+			parts.append("([^/])")
+		elif character == "[" and (end := pattern.find("]", index + 2)) != -1:
+			characters = pattern[index + 1:end]
+			if characters.startswith("!"):
+				characters = "^" + characters[1:]
+			parts.append(f"([{characters.replace(chr(92), chr(92) * 2)}])")
+			index = end
+		else:
+			parts.append(escape(character))
+		index += 1
+	return "".join(parts)
+
+def escape_glob(text):
+	return "".join(f"[{x}]" if x in "*?[" else x for x in text)
+
+def glob_scope(pattern):
+	# only the part of a glob below its last directory without wildcards needs searching
+	wildcard_position = min((pattern.find(x) for x in "*?[" if x in pattern), default=len(pattern))
+	prefix = pattern[:pattern.rfind("/", 0, wildcard_position) + 1]
+	remaining_pattern = pattern[len(prefix):]
+	return prefix, "/" in remaining_pattern or "**" in remaining_pattern, wildcard_position
+
+capture_placeholder_regex = compile(r"\{(\d+)\}")
+
+def match_pairs(root, source_pattern, destination_pattern, regex=False):
+	sources = [(path, file, match) for path, file, match in root.find(source_pattern, regex) if not isinstance(file, Directory)]
+	if not sources:
+		raise SwapError(f"No files match '{source_pattern}'")
+	
+	def get_path(path):
+		try:
+			file = root.get_path(path)
+		except SwapError:
+			return []
+		# get_path stops early at a file it can't go into, which isn't a match
+		return [file] if file.name == path.rsplit("/", 1)[-1] else []
+	
+	# every destination pattern in the same directory shares one sorted listing of it,
+	# so each one only checks the paths that start with its text before the first wildcard
+	listings = {}
+	def find(pattern):
+		prefix, recursive, wildcard_position = glob_scope(pattern)
+		if (prefix, recursive) not in listings:
+			listing = sorted(root.glob_candidates(prefix, recursive), key=lambda entry: entry[0])
+			listings[(prefix, recursive)] = ([path for path, _ in listing], listing)
+		paths, listing = listings[(prefix, recursive)]
+		
+		literal = pattern[:wildcard_position]
+		expression = compile(glob_to_regex(pattern))
+		files = []
+		for path, file in listing[bisect_left(paths, literal):]:
+			if not path.startswith(literal):
+				break
+			if expression.fullmatch(path):
+				files.append(file)
+		return files
+	
+	exact = not any(x in capture_placeholder_regex.sub("", destination_pattern) for x in "*?[")
+	
+	pairs = []
+	for _, source, match in sources:
+		if regex:
+			destinations = get_path(match.expand(destination_pattern))
+		else:
+			def capture(placeholder):
+				index = int(placeholder.group(1))
+				if not 1 <= index <= len(match.groups()):
+					raise SwapError(f"'{destination_pattern}' uses {{{index}}}, but '{source_pattern}' only has {len(match.groups())} wildcards")
+				return match.group(index) if exact else escape_glob(match.group(index))
+			
+			pattern = capture_placeholder_regex.sub(capture, destination_pattern)
+			destinations = get_path(pattern) if exact else find(pattern)
+		
+		pairs += [(source, x) for x in destinations if x is not source and not isinstance(x, Directory)]
+	return pairs
+
+def list_files(root, pattern=None, regex=False):
+	if pattern:
+		entries = [(path, file) for path, file, _ in root.find(pattern, regex)]
+	else:
+		entries = root.walk()
+	
+	return [
+		{
+			"path": path,
+			"id": file.id,
+			"type": "directory" if isinstance(file, Directory) else "file",
+			"offset": file.start_address,
+			"size": file.length,
+		}
+		for path, file in entries
+	]
+
+def export_listing(listing, listing_file):
+	if listing_file.lower().endswith(".json"):
+		with open(listing_file, "w") as file:
+			json.dump(listing, file, indent=1)
+	else:
+		with open(listing_file, "w", newline="") as file:
+			writer = csv.DictWriter(file, ["path", "id", "type", "offset", "size"])
+			writer.writeheader()
+			writer.writerows(listing)
+
+def print_listing(listing):
+	for entry in listing:
+		if entry["type"] == "directory":
+			print(f"{entry['id']:#06x}                          {entry['path']}/")
+		else:
+			print(f"{entry['id']:#06x}  0x{entry['offset']:08X}  {entry['size']:>10}  {entry['path']}")
+
+# MARK: Extracting and repacking
+def files_to_extract(root, pattern=None):
+	if not pattern:
+		entries = root.walk()
+	elif isinstance(root.paths.get(pattern.rstrip("/")), Directory):
+		entries = root.paths[pattern.rstrip("/")].walk(pattern.rstrip("/") + "/")
+	else:
+		entries = ((path, file) for path, file, _ in root.find(pattern))
+	
+	return sorted(
+		((path, file) for path, file in entries if not isinstance(file, Directory)),
+		key=lambda entry: entry[1].start_address
+	)
+
+def extract(rom, output_directory, pattern=None, workers=None):
+	files = files_to_extract(rom.root, pattern)
+	for directory in {dirname(join(output_directory, path)) for path, _ in files}:
+		os.makedirs(directory, exist_ok=True)
+	
+	def extract_file(entry):
+		path, file = entry
+		with open(join(output_directory, path), "wb") as output_file:
+			output_file.write(rom.contents(file))
+		return file.length
+	
+	# files are handed out in ROM order, so the reads from the map stay sequential
+	with rom.stats.phase("extract"):
+		with ThreadPoolExecutor(workers or os.cpu_count() or 1) as executor:
+			extracted_bytes = sum(executor.map(extract_file, files))
+	
+	rom.stats.count("opens", len(files))
+	rom.stats.count("writes", len(files))
+	rom.stats.count("bytes_read", extracted_bytes)
+	rom.stats.count("bytes_written", extracted_bytes)
+	return len(files), extracted_bytes
+
+def align(offset, alignment):
+	return -(-offset // alignment) * alignment
+
+class Repacker:
+	ALIGNMENT = 0x200
+	
+	def __init__(self, rom, debug=False):
+		self.rom = rom
+		self.debug = debug
+		self.replacements = {}
+		self.placements = {}
+	
+	def replace(self, file, data):
+		if isinstance(file, Directory):
+			raise SwapError(f"{file} is a directory, and can't be replaced")
+		self.replacements[file] = data
+	
+	def writes(self):
+		rom = self.rom
+		files = [file for _, file in rom.root.walk() if not isinstance(file, Directory)]
+		users = {}
+		for file in files:
+			users[file.start_address] = users.get(file.start_address, 0) + 1
+		
+		header = bytearray(rom.read(0, 0x15E))
+		rom_size, = unpack_from("<I", header, 0x80)
+		end = align(max([rom_size] + [file.start_address + file.length for file in files]), self.ALIGNMENT)
+		
+		data_writes = []
+		table_writes = []
+		self.placements = {}
+		for file, data in sorted(self.replacements.items(), key=lambda replacement: replacement[0].start_address):
+			# data shared with another file can't be changed in place
+			if len(data) <= file.length and users.get(file.start_address, 1) == 1:
+				start_address = file.start_address
+			elif file.table is not rom.root.table:
+				raise SwapError(f"{file} is inside an archive, so it can't be made bigger or moved")
+			else:
+				start_address = end
+				end = align(end + len(data), self.ALIGNMENT)
+				if self.debug:
+					print(f"Relocating {file} from 0x{file.start_address:X} to 0x{start_address:X}")
+			
+			data_writes.append((start_address, data))
+			self.placements[file] = (start_address, data)
+			if (start_address, len(data)) != (file.start_address, file.length):
+				table_writes.append((file.table.entry_offset(file.id), file.table.pack_entry(start_address, len(data))))
+		
+		header_writes = []
+		used_size = max([rom_size] + [offset + len(data) for offset, data in data_writes])
+		if used_size != rom_size:
+			header[0x80:0x84] = pack("<I", used_size)
+			while 0x20000 << header[0x14] < used_size:
+				header[0x14] += 1
+			header_writes.append((0, bytes(header) + pack("<H", crc16(header))))
+		
+		return sorted(header_writes + merge_writes(table_writes) + data_writes, key=lambda write: write[0])
+	
+	def write(self, output_nds_file, stats=None):
+		stats = stats or self.rom.stats
+		writes = self.writes()
+		
+		with stats.phase("copy ROM"):
+			cloned = clone_file(self.rom.path, output_nds_file)
+		stats.count("opens", 2)
+		if not cloned:
+			stats.count("bytes_written", len(self.rom.map))
+		
+		with stats.phase("repack"):
+			stats.count("opens")
+			with open(output_nds_file, "r+b") as output_file:
+				RangeCopier(self.rom, output_file, stats).copy([(offset, len(data), None, data) for offset, data in writes])
+		return len(self.replacements)
+
+def repack(rom, input_directory, output_nds_file, pattern=None, debug=False):
+	repacker = Repacker(rom, debug)
+	with rom.stats.phase("compare files"):
+		for path, file in files_to_extract(rom.root, pattern):
+			file_name = join(input_directory, path)
+			if not isfile(file_name):
+				continue
+			
+			with open(file_name, "rb") as input_file:
+				data = input_file.read()
+			rom.stats.count("opens")
+			rom.stats.count("bytes_read", len(data))
+			
+			if len(data) != file.length or rom.contents(file) != data:
+				if debug:
+					print(f"{path} changed")
+				repacker.replace(file, data)
+	
+	return repacker.write(output_nds_file)
+
+# MARK: Compression
+LZ10 = 0x10
+LZ11 = 0x11
+HUFFMAN4 = 0x24
+HUFFMAN8 = 0x28
+RLE = 0x30
+COMPRESSION_LABELS = {LZ10: "LZ10", LZ11: "LZ11", HUFFMAN4: "4-bit Huffman", HUFFMAN8: "8-bit Huffman", RLE: "RLE"}
+
+def compression_type(data):
+	if len(data) >= 4 and data[0] in COMPRESSION_LABELS:
+		return data[0]
+	return None
+
+def compression_header(kind, size):
+	# an empty size in the short header means the size follows, so empty data needs the long one too
+	if size == 0 or size > 0xFFFFFF:
+		return pack("<II", kind, size)
+	return pack("<I", kind | size << 8)
+
+def read_compression_header(data):
+	size = data[1] | data[2] << 8 | data[3] << 16
+	if size == 0 and len(data) >= 8:
+		size, = unpack_from("<I", data, 4)
+		return size, 8
+	return size, 4
+
+def decompress(data):
+	data = bytes(data)
+	kind = compression_type(data)
+	try:
+		if kind in [LZ10, LZ11]:
+			return decompress_lz(data, kind == LZ11)
+		elif kind in [HUFFMAN4, HUFFMAN8]:
+			return decompress_huffman(data, kind == HUFFMAN4)
+		elif kind == RLE:
+			return decompress_rle(data)
+	except IndexError:
+		raise SwapError("Compressed data ended early")
+	raise SwapError(f"Unknown compression type: 0x{data[0] if data else 0:02X}")
+
+def decompress_lz(data, extended):
+	size, position = read_compression_header(data)
+	output = bytearray()
+	
+	while len(output) < size:
+		flags = data[position]
+		position += 1
+		
+		# eight literals in a row are common enough to copy at once
+		if flags == 0 and len(output) + 8 <= size:
+			if position + 8 > len(data):
+				raise IndexError
+			output += data[position:position + 8]
+			position += 8
+			continue
+		
+		for bit in range(8):
+			if len(output) >= size:
+				break
+			
+			if not flags & 0x80 >> bit:
+				output.append(data[position])
+				position += 1
+				continue
+			
+			first = data[position]
+			if not extended:
+				length = (first >> 4) + 3
+				displacement = ((first & 0xF) << 8 | data[position + 1]) + 1
+				position += 2
+			elif first >> 4 == 0:
+				length = ((first & 0xF) << 4 | data[position + 1] >> 4) + 0x11
+				displacement = ((data[position + 1] & 0xF) << 8 | data[position + 2]) + 1
+				position += 3
+			elif first >> 4 == 1:
+				length = ((first & 0xF) << 12 | data[position + 1] << 4 | data[position + 2] >> 4) + 0x111
+				displacement = ((data[position + 2] & 0xF) << 8 | data[position + 3]) + 1
+				position += 4
+			else:
+				length = (first >> 4) + 1
+				displacement = ((first & 0xF) << 8 | data[position + 1]) + 1
+				position += 2
+			
+			start = len(output) - displacement
+			if start < 0:
+				raise SwapError("Compressed data refers to data before its start")
+			
+			if displacement >= length:
+				output += output[start:start + length]
+			else:
+				# overlapping copies repeat the last `displacement` bytes
+				output += (output[start:] * (length // displacement + 1))[:length]
+	
+	return bytes(output[:size])
+
+def decompress_rle(data):
+	size, position = read_compression_header(data)
+	output = bytearray()
+	
+	while len(output) < size:
+		flag = data[position]
+		position += 1
+		if flag & 0x80:
+			output += data[position:position + 1] * ((flag & 0x7F) + 3)
+			position += 1
+		else:
+			length = (flag & 0x7F) + 1
+			output += data[position:position + length]
+			position += length
+		
+		if position > len(data):
+			raise IndexError
+	
+	return bytes(output[:size])
+
+def decompress_huffman(data, four_bit):
+	size, header_length = read_compression_header(data)
+	root = header_length + 1
+	stream_start = header_length + (data[header_length] + 1) * 2
+	symbol_count = size * 2 if four_bit else size
+	
+	# each entry decodes one whole byte of the bitstream, starting at a given node
+	table = {}
+	def decode_byte(start, byte):
+		node = start
+		symbols = []
+		for bit in range(7, -1, -1):
+			value = data[node]
+			child = (node & ~1) + (value & 0x3F) * 2 + 2
+			if byte >> bit & 1:
+				child += 1
+				is_leaf = value & 0x40
+			else:
+				is_leaf = value & 0x80
+			
+			if is_leaf:
+				symbols.append(data[child])
+				node = root
+			else:
+				node = child
+		
+		table[(start, byte)] = entry = (symbols, node)
+		return entry
+	
+	symbols = []
+	node = root
+	for position in range(stream_start, len(data) - 3, 4):
+		# bits are read from the most significant end of each little-endian word
+		for byte in (data[position + 3], data[position + 2], data[position + 1], data[position]):
+			entry = table.get((node, byte)) or decode_byte(node, byte)
+			symbols += entry[0]
+			node = entry[1]
+		if len(symbols) >= symbol_count:
+			break
+	
+	if len(symbols) < symbol_count:
+		raise IndexError
+	
+	if four_bit:
+		return bytes(symbols[i] | symbols[i + 1] << 4 for i in range(0, symbol_count, 2))
+	return bytes(symbols[:size])
+
+def compress(data, kind):
+	if kind in [LZ10, LZ11]:
+		return compress_lz(data, kind == LZ11)
+	elif kind == RLE:
+		return compress_rle(data)
+	elif kind in [HUFFMAN4, HUFFMAN8]:
+		return compress_huffman(data, kind == HUFFMAN4)
+	elif kind is None:
+		return bytes(data)
+	raise SwapError(f"Unknown compression type: 0x{kind:02X}")
+
+def compress_lz(data, extended=False, max_chain=128):
+	data = bytes(data)
+	size = len(data)
+	max_length = 0x10110 if extended else 0x12
+	output = bytearray(compression_header(LZ11 if extended else LZ10, size))
+	
+	# positions of every 3 byte prefix seen so far, newest last
+	prefixes = {}
+	def remember(start, end):
+		for i in range(start, min(end, size - 2)):
+			prefixes.setdefault(data[i:i + 3], []).append(i)
+	
+	position = 0
+	while position < size:
+		flags_position = len(output)
+		output.append(0)
+		
+		for bit in range(8):
+			if position >= size:
+				break
+			
+			best_length = 0
+			best_displacement = 0
+			longest = min(max_length, size - position)
+			for checked, candidate in enumerate(reversed(prefixes.get(data[position:position + 3], ()))):
+				displacement = position - candidate
+				if displacement > 0x1000 or checked >= max_chain:
+					break
+				
+				length = 3
+				while length < longest and data[candidate + length] == data[position + length]:
+					length += 1
+				if length > best_length:
+					best_length = length
+					best_displacement = displacement
+					if length == longest:
+						break
+			
+			if best_length < 3:
+				output.append(data[position])
+				remember(position, position + 1)
+				position += 1
+				continue
+			
+			output[flags_position] |= 0x80 >> bit
+			length = best_length
+			displacement = best_displacement - 1
+			if not extended:
+				output += bytes([(length - 3) << 4 | displacement >> 8, displacement & 0xFF])
+			elif length <= 0x10:
+				output += bytes([(length - 1) << 4 | displacement >> 8, displacement & 0xFF])
+			elif length <= 0x110:
+				length -= 0x11
+				output += bytes([length >> 4, (length & 0xF) << 4 | displacement >> 8, displacement & 0xFF])
+			else:
+				length -= 0x111
+				output += bytes([0x10 | length >> 12, length >> 4 & 0xFF, (length & 0xF) << 4 | displacement >> 8, displacement & 0xFF])
+			
+			remember(position, position + best_length)
+			position += best_length
+	
+	output += bytes(-len(output) % 4)
+	return bytes(output)
+
+def compress_huffman(data, four_bit):
+	data = bytes(data)
+	size = len(data)
+	output = bytearray(compression_header(HUFFMAN4 if four_bit else HUFFMAN8, size))
+	symbols = [nibble for byte in data for nibble in (byte & 0xF, byte >> 4)] if four_bit else data
+	
+	# ties are broken by creation order, so the same data always gets the same tree
+	heap = [(count, symbol, symbol) for symbol, count in sorted(Counter(symbols).items())]
+	heapify(heap)
+	order = 0x100
+	while len(heap) > 1:
+		count1, _, node1 = heappop(heap)
+		count2, _, node2 = heappop(heap)
+		heappush(heap, (count1 + count2, order, (node1, node2)))
+		order += 1
+	
+	# a tree needs two children at its root, even with one symbol or none
+	tree = heap[0][2] if heap else 0
+	if not isinstance(tree, tuple):
+		tree = (tree, tree)
+	
+	codes = {}
+	def assign_codes(node, code):
+		if isinstance(node, tuple):
+			assign_codes(node[0], code + "0")
+			assign_codes(node[1], code + "1")
+		else:
+			codes[node] = code
+	assign_codes(tree, "")
+	
+	# the tree is stored as pairs of children, and each node can only point up to 63 pairs ahead
+	# children are laid out depth first to keep few nodes waiting, unless that would leave a waiting node out of reach
+	pairs = [[0, 0]]
+	waiting = [(0x40, 0, 1, tree)]
+	while waiting:
+		position = len(pairs)
+		deadlines = sorted(x[0] for x in waiting[:-1])
+		if all(deadline >= position + 1 + i for i, deadline in enumerate(deadlines)):
+			deadline, parent, slot, node = waiting.pop()
+		else:
+			deadline, parent, slot, node = waiting.pop(min(range(len(waiting)), key=lambda i: waiting[i][0]))
+		if deadline < position:
+			raise SwapError("Too many different symbols to fit in a Huffman tree")
+		
+		pairs[parent][slot] = position - parent - 1
+		pair = [0, 0]
+		for child_slot, child in enumerate(node):
+			if isinstance(child, tuple):
+				waiting.append((position + 0x40, position, child_slot, child))
+			else:
+				pairs[parent][slot] |= 0x80 >> child_slot
+				pair[child_slot] = child
+		pairs.append(pair)
+	
+	# the bitstream is read in 32 bit words, so the tree is padded to keep it aligned
+	if len(pairs) % 2:
+		pairs.append([0, 0])
+	pairs[0][0] = len(pairs) - 1
+	for pair in pairs:
+		output += bytes(pair)
+	
+	bits = "".join(codes[symbol] for symbol in symbols)
+	bits += "0" * (-len(bits) % 32)
+	for start in range(0, len(bits), 32):
+		output += pack("<I", int(bits[start:start + 32], 2))
+	return bytes(output)
+
+def compress_rle(data):
+	data = bytes(data)
+	size = len(data)
+	output = bytearray(compression_header(RLE, size))
+	
+	def flush_literals(start, end):
+		for chunk_start in range(start, end, 0x80):
+			chunk = data[chunk_start:min(end, chunk_start + 0x80)]
+			output.append(len(chunk) - 1)
+			output.extend(chunk)
+	
+	literal_start = 0
+	position = 0
+	while position < size:
+		run_length = 1
+		while run_length < 0x82 and position + run_length < size and data[position + run_length] == data[position]:
+			run_length += 1
+		
+		if run_length >= 3:
+			flush_literals(literal_start, position)
+			output.append(0x80 | run_length - 3)
+			output.append(data[position])
+			position += run_length
+			literal_start = position
+		else:
+			position += run_length
+	flush_literals(literal_start, size)
+	
+	output += bytes(-len(output) % 4)
+	return bytes(output)
+
+# MARK: Models
+class MM3:
+	def __init__(self, indexes, names):
+		self.indexes = indexes
+		self.names = names
+	
+	@classmethod
+	def from_bytes(cls, data):
+		data = bytes(data)
+		if data[:4] != b"MM3\0" or len(data) < 12:
+			raise SwapError("Not an MM3 file")
+		
+		first_name_offset, = unpack_from("<I", data, 8)
+		count = (first_name_offset - 4) // 8
+		if count < 1 or 4 + count * 8 > len(data):
+			raise SwapError("Broken MM3 file, its index list doesn't fit in it")
+		
+		indexes = []
+		names = []
+		for i in range(count):
+			index, name_offset = unpack_from("<II", data, 4 + i * 8)
+			name_end = data.find(b"\0", name_offset)
+			if name_end == -1:
+				raise SwapError("Broken MM3 file, a table name isn't terminated")
+			indexes.append(index)
+			names.append(data[name_offset:name_end].decode())
+		return cls(indexes, names)
+	
+	def to_bytes(self):
+		header = bytearray(b"MM3\0")
+		names = bytearray()
+		name_offset = 4 + len(self.indexes) * 8
+		for index, name in zip(self.indexes, self.names):
+			header += pack("<II", index, name_offset + len(names))
+			names += name.encode() + b"\0"
+			names += bytes(-len(names) % 4)
+		return bytes(header + names)
+	
+	def __repr__(self):
+		return " ".join(["MM3"] + [f"{index} ({name})" for index, name in zip(self.indexes, self.names)])
+
+def list_models(rom, pattern):
+	models = []
+	for path, file, _ in rom.root.find(pattern):
+		if isinstance(file, Directory) or file.length < 4:
+			continue
+		
+		data = rom.contents(file)
+		if data[:4] != b"MM3\0" and compression_type(data) is None:
+			continue
+		try:
+			kind, model = read_model(rom, file)
+		except SwapError:
+			continue
+		models.append((path, kind, model))
+	return models
+
+def read_model(rom, file):
+	if isinstance(file, Directory):
+		raise SwapError(f"{file} is a directory, not a model")
+	data = rom.contents(file)
+	kind = compression_type(data)
+	return kind, MM3.from_bytes(rom.decompressed(file) if kind is not None else data)
+
+def remap_model(rom, source, destination):
+	try:
+		_, source_model = read_model(rom, source)
+		kind, destination_model = read_model(rom, destination)
+	except SwapError as exception:
+		raise SwapError(f"Can't remap {source} to {destination}: {exception}")
+	
+	if len(source_model.indexes) != len(destination_model.indexes):
+		raise SwapError(f"{source} and {destination} have a different number of model indexes")
+	
+	destination_model.indexes = list(source_model.indexes)
+	return compress(destination_model.to_bytes(), kind)
+
+# MARK: Sessions
+class Session:
+	def __init__(self, rom, output_nds_file, weird_sprint=True, pointer_mode=False, patch_format=None, dedup=False, incremental=True, verify=False, mm3_mode=False, fallbacks=None, debug=False, copy_rom=True):
+		self.rom = rom
+		self.root = rom.root
+		self.output_nds_file = output_nds_file
+		self.weird_sprint = weird_sprint
+		if fallbacks is None:
+			fallbacks = ANIMATION_FALLBACKS if weird_sprint else {}
+		self.fallbacks = fallbacks
+		self.characters = self.root.characters
+		if self.characters is None:
+			self.characters = CharacterIndex([])
+		self.patch_format = patch_format
+		self.debug = debug
+		self.plan = MovePlan(pointer_mode, debug, rom.content_index() if dedup else None, rom if mm3_mode else None)
+		# without copy_rom, the output is expected to already be a copy of the input, and moves are written straight into it
+		self.output_created = not copy_rom
+		self.incremental = incremental
+		self.verify_writes = verify
+		self.journal = None
+		self.expected = {}
+		self.restored = set()
+		self.expected_size = None
+		self.repacker = None
+		self.stats = Stats()
+	
+	def move_path(self, path1, path2):
+		return self.move(self.root.get_path(path1), self.root.get_path(path2))
+	
+	def move(self, source, destination):
+		with self.stats.phase("plan moves"):
+			self.plan.add(source, destination)
+	
+	def swap_path(self, path1, path2):
+		return self.swap(self.root.get_path(path1), self.root.get_path(path2))
+	
+	def find(self, pattern, regex=False):
+		return [file for _, file, _ in self.root.find(pattern, regex)]
+	
+	def move_matching(self, source_pattern, destination_pattern, regex=False):
+		pairs = match_pairs(self.root, source_pattern, destination_pattern, regex)
+		with self.stats.phase("plan moves"):
+			for source, destination in pairs:
+				if self.debug:
+					print(source, destination)
+				self.plan.add(source, destination)
+		return len(pairs)
+	
+	def swap_matching(self, pattern1, pattern2, regex=False):
+		pairs = match_pairs(self.root, pattern1, pattern2, regex)
+		with self.stats.phase("plan moves"):
+			for file1, file2 in pairs:
+				if self.debug:
+					print(file1, file2)
+				self.plan.add(file1, file2)
+				self.plan.add(file2, file1)
+		return len(pairs)
+	
+	def swap(self, source, destination):
+		self.move(source, destination)
+		self.move(destination, source)
+	
+	def get_character(self, character_number, variation):
+		return get_character(self.root, character_number, variation)
+	
+	def swap_characters(self, source_models, destination_models):
+		self.move_character(source_models, destination_models)
+		self.move_character(destination_models, source_models)
+	
+	def move_character(self, source_models, destination_models):
+		with self.stats.phase("plan moves"):
+			self._move_character(source_models, destination_models)
+	
+	def _move_character(self, source_models, destination_models):
+		moves, gaps, missing = self.characters.plan_move(source_models, destination_models, self.fallbacks)
+		
+		# nothing is planned unless every fallback can be filled in
+		if missing:
+			animations = sorted({x.character_info.animation_number for x in missing})
+			message = f"Cannot fill in animation {', '.join(f'{x:02}' for x in animations)} for {', '.join(map(str, missing))}, no fallback animation found."
+			if 3 in animations and self.weird_sprint:
+				message += " Please disable ADD_WEIRD_SPRINT by adding the flag --disable-weird-sprint"
+			raise SwapError(message)
+		
+		if gaps:
+			print(f"No source for {', '.join(map(str, gaps))}, left unchanged")
+		
+		for source, destination, fallback in moves:
+			if self.debug:
+				if fallback:
+					print("FALLBACK: ", end="")
+				print(source, destination)
+			self.move(source, destination)
+	
+	def write(self):
+		if self.patch_format:
+			with self.stats.phase("write patch"):
+				self.plan.write_patch(self.rom, self.output_nds_file, self.patch_format, self.stats)
+			return
+		
+		if self.plan.model_rom is not None:
+			self.write_models()
+		else:
+			self.write_moves()
+		
+		if self.verify_writes:
+			results = self.verify()
+			failures = [label for label, passed in results if not passed]
+			if self.debug:
+				for label, passed in results:
+					print(f"{label}: {'ok' if passed else 'FAILED'}")
+			if failures:
+				raise SwapError(f"Verification failed for {len(failures)}/{len(results)} checks: {', '.join(failures)}")
+			print(f"Verified {len(results)} checks")
+	
+	def write_moves(self):
+		restore = False
+		if not self.output_created:
+			input_fingerprint = rom_fingerprint(self.rom)[:3]
+			if self.incremental:
+				self.journal = Journal.load(self.output_nds_file, input_fingerprint)
+			
+			if self.journal is not None:
+				restore = True
+				if self.debug:
+					print(f"Updating '{self.output_nds_file}' in place using its journal")
+			else:
+				# a stale journal must not outlive a failed copy
+				remove_journal(self.output_nds_file)
+				with self.stats.phase("copy ROM"):
+					cloned = clone_file(self.rom.path, self.output_nds_file)
+				self.stats.count("opens", 2)
+				if not cloned:
+					self.stats.count("bytes_written", len(self.rom.map))
+				self.journal = Journal(self.output_nds_file, input_fingerprint)
+			self.output_created = True
+		
+		with self.stats.phase("write moves"):
+			entries, restores = self.plan.write(self.rom, self.output_nds_file, self.stats, self.journal, restore)
+			# an output that was copied outside of the session has no journal to keep
+			if self.journal is not None:
+				self.journal.save()
+		
+		for offset, length, _, _ in restores:
+			self.expected.pop((offset, length), None)
+			self.restored.add((offset, length))
+		for destination, (offset, length, digest) in entries.items():
+			self.restored.discard((offset, length))
+			self.expected[(offset, length)] = (f"{destination} (pointer)" if self.plan.pointer_mode else str(destination), digest)
+	
+	def write_models(self):
+		if self.repacker is None:
+			# the output is copied again on every write, so there's nothing for a journal to track
+			remove_journal(self.output_nds_file)
+			self.repacker = Repacker(self.rom, self.debug)
+			self.output_created = True
+		
+		with self.stats.phase("write models"):
+			self.plan.write_models(self.repacker, self.output_nds_file, self.stats)
+		
+		self.expected = {
+			(offset, len(data)): (f"{file} (model)", blake2b(data, digest_size=16).digest())
+			for file, (offset, data) in self.repacker.placements.items()
+		}
+		self.expected_size = max([len(self.rom.map)] + [offset + len(data) for offset, data in self.repacker.placements.values()])
+	
+	def verify(self):
+		if self.patch_format:
+			raise SwapError("Patches can't be verified, apply them first")
+		
+		with self.stats.phase("verify"):
+			return verify_output(self.rom, self.output_nds_file, self.expected, self.restored, size=self.expected_size)
+
+# MARK: Plans
+PLAN_OPERATIONS = ["move", "swap", "move_matching", "swap_matching", "move_character", "swap_characters"]
+
+def load_plan(plan_file):
+	try:
+		if plan_file.lower().endswith(".toml"):
+			if tomllib is None:
+				raise SwapError("TOML plans need Python 3.11 or newer, use a JSON plan instead")
+			with open(plan_file, "rb") as file:
+				plan = tomllib.load(file)
+		else:
+			with open(plan_file) as file:
+				plan = json.load(file)
+	except (ValueError, OSError) as exception:
+		raise SwapError(f"Couldn't read plan '{plan_file}': {exception}")
+	
+	operations = plan.get("operations") if isinstance(plan, dict) else None
+	if not isinstance(operations, list):
+		raise SwapError(f"Plan '{plan_file}' needs a list of operations")
+	
+	for index, operation in enumerate(operations):
+		if not isinstance(operation, dict) or len(operation) != 1:
+			raise SwapError(f"Operation #{index + 1} should have exactly one of: {', '.join(PLAN_OPERATIONS)}")
+		
+		kind, arguments = next(iter(operation.items()))
+		if kind not in PLAN_OPERATIONS:
+			raise SwapError(f"Operation #{index + 1} is unknown: '{kind}'")
+		if not isinstance(arguments, list) or len(arguments) != 2 or not all(isinstance(x, str) for x in arguments):
+			raise SwapError(f"Operation #{index + 1} ({kind}) needs two arguments, got {arguments!r}")
+	
+	return operations
+
+def parse_plan_character(session, character):
+	# "1*" means every variation, like `get_character(root, 1, "")`
+	if character.endswith("*"):
+		character_number, _ = parse_character(character[:-1])
+		character_variation = ""
+	else:
+		character_number, character_variation = parse_character(character)
+	
+	models = session.get_character(character_number, character_variation)
+	if not models:
+		raise SwapError(f"No models found for character {character}")
+	return models
+
+def run_plan(session, operations):
+	for index, operation in enumerate(operations):
+		kind, (first, second) = next(iter(operation.items()))
+		session.plan.origin = f"#{index + 1} {kind} {first} {second}"
+		
+		try:
+			if kind == "move":
+				session.move_path(first, second)
+			elif kind == "swap":
+				session.swap_path(first, second)
+			elif kind == "move_matching":
+				session.move_matching(first, second)
+			elif kind == "swap_matching":
+				session.swap_matching(first, second)
+			elif kind == "move_character":
+				session.move_character(parse_plan_character(session, first), parse_plan_character(session, second))
+			else:
+				session.swap_characters(parse_plan_character(session, first), parse_plan_character(session, second))
+		except SwapError as exception:
+			raise SwapError(f"Operation {session.plan.origin}: {exception}")
+	
+	session.plan.origin = None
+
+def describe_plan(session):
+	plan = session.plan
+	paths = {file: path for path, file in walk_opened_archives(session.root)}
+	
+	def path(file):
+		return paths.get(file) or str(file)
+	
+	lines = []
+	for destination, previous_source, previous_origin, source, origin in plan.conflicts:
+		lines.append(f"\033[33mConflict: {path(destination)} was set to {path(previous_source)} by {previous_origin}, then to {path(source)} by {origin}\033[0m")
+	
+	lines.append(f"Resolved plan ({len(plan.moves)} writes, {plan.dead_writes} overwritten writes dropped):")
+	for destination, source in sorted(plan.moves.items(), key=lambda move: move[0].start_address):
+		lines.append(f"    {path(destination)} <- {path(source)}")
+	return "\n".join(lines)
+
+# MARK: Batches
+batch_rom = None
+batch_options = {}
+
+def batch_character_specs(root, character_specs):
+	if "all" not in character_specs:
+		return character_specs
+	
+	character_specs = []
+	for character_number in range(48):
+		models = get_character(root, character_number, "")
+		if not models:
+			continue
+		
+		variations = sorted({x.character_info.variation for x in models} - {""})
+		if variations:
+			character_specs += [f"{character_number}{variation}" for variation in variations]
+		else:
+			character_specs.append(str(character_number))
+	return character_specs
+
+def init_batch_worker(input_nds_file, options):
+	global IS_EXE, batch_rom, batch_options
+	IS_EXE = False
+	if batch_rom is None:
+		batch_rom = Rom(input_nds_file)
+	batch_options = options
+
+def build_variant(character_spec):
+	start = perf_counter()
+	output = StringIO()
+	session = None
+	try:
+		with redirect_stdout(output):
+			character_number, character_variation = parse_character(character_spec)
+			extension = batch_options.get("patch_format") or "nds"
+			output_nds_file = f"{batch_rom.path[:-4]} - {character_spec}.{extension}"
+			session = Session(batch_rom, output_nds_file, **batch_options)
+			swap_with_hunter(session, character_number, character_variation)
+			session.write()
+	except Exception as exception:
+		message = str(exception) if isinstance(exception, SwapError) else repr(exception)
+		stats = session.stats.report() if session else Stats().report()
+		return character_spec, perf_counter() - start, output.getvalue(), message, stats
+	
+	return character_spec, perf_counter() - start, output.getvalue(), None, session.stats.report()
+
+def build_batch(rom, character_specs, **options):
+	global batch_rom
+	batch_rom = rom
+	character_specs = batch_character_specs(rom.root, character_specs)
+	if options.get("dedup"):
+		rom.content_index()
+	
+	# resolving the Hunter swaps here fills the character plan cache that forked workers start with
+	characters = rom.root.characters
+	if characters is not None:
+		fallbacks = options.get("fallbacks")
+		if fallbacks is None:
+			fallbacks = ANIMATION_FALLBACKS if options.get("weird_sprint", True) else {}
+		
+		all_hunters = get_character(rom.root, 1, "")
+		hunter_deinonychus = get_character(rom.root, 1, "c")
+		for character_spec in character_specs:
+			try:
+				input_character = get_character(rom.root, *parse_character(character_spec))
+			except SwapError:
+				continue
+			characters.plan_move(input_character, all_hunters, fallbacks)
+			characters.plan_move(hunter_deinonychus, input_character, fallbacks)
+	
+	if "fork" in get_all_start_methods():
+		context = get_context("fork")
+	else:
+		context = get_context()
+	
+	with ProcessPoolExecutor(mp_context=context, initializer=init_batch_worker, initargs=(rom.path, options)) as executor:
+		yield from executor.map(build_variant, character_specs)
+
+
+# ╭──────────────────────────────────────────────────────────────────────────╮
+# │ Commands                                                                 │
+# ├──────────────────────────────────────────────────────────────────────────┤
+# │ Custom commands go in `custom_commands` below, which is given a session. │
+# │ The same commands can be used from other scripts, for example:           │
+# │ > from ff1_asset_swapper import Rom, Session                             │
+# │ > rom = Rom("Fossil Fighters.nds")                                       │
+# │ > session = Session(rom, "Fossil Fighters - my mod.nds")                 │
+# │ > session.swap_path("model/fieldchar/head01a", "model/fieldchar/head02") │
+# │ > session.write()                                                        │
+# │ A Rom can be shared by any number of sessions, and importing the script  │
+# │ doesn't run anything.                                                    │
+# │                                                                          │
+# │ Rom(input_nds_file, cache, full_hash)                                    │
+# │     The memory-mapped input ROM. `rom.contents(file)` returns the data   │
+# │     of a file object as a memoryview, without copying it. cache turns    │
+# │     the '.index' cache on or off, and full_hash is FULL_HASH.            │
+# │                                                                          │
+# │ Session(rom, output_nds_file, weird_sprint, pointer_mode, patch_format,  │
+# │         dedup, incremental, verify, mm3_mode, fallbacks, debug,          │
+# │         copy_rom)                                                        │
+# │     A set of moves from rom to output_nds_file. The options are the same │
+# │     as the command line options with the same names, and are optional.   │
+# │     fallbacks maps an animation number to a list of animations to use    │
+# │     instead when a moved character doesn't have it, like {3: [2]}, which │
+# │     is the default when weird_sprint is on. With copy_rom=False, moves   │
+# │     are written straight into output_nds_file, which has to be a copy of │
+# │     the input ROM already, without a journal.                            │
+# │                                                                          │
+# │ root                                                                     │
+# │     An object representing the root directory of the ROM, also available │
+# │     as `session.root` and `rom.root`. This is created with               │
+# │     `create_file_structure` the first time it's used.                    │
+# │                                                                          │
+# │ root.get_path(path)                                                      │
+# │     Given a file path, returns the file object at that path.             │
+# │     Raises a SwapError if an invalid path is provided.                   │
+# │                                                                          │
+# │     Paths can go into NARC archives as if they were directories, like    │
+# │     "path/to/archive.narc/member.bin", and archives without names use    │
+# │     numbers instead ("path/to/archive.narc/0"). An archive's tables      │
+# │     are only read the first time a path goes into it, and nothing is     │
+# │     extracted. Archive members can be moved and swapped like any other   │
+# │     file, as long as they're the same size. In pointer mode, they can    │
+# │     only be pointed at members of the same archive.                      │
+# │                                                                          │
+# │ session.move(source, destination)                                        │
 # │     Given two file objects, copy the data in the first (by reading from  │
 # │     input_nds_file) to the second (by writing to output_nds_file).       │
 # │                                                                          │
+# │     In pointer mode, the second file is instead pointed at the data of   │
+# │     the first, and the two files don't need to be the same size.         │
+# │                                                                          │
+# │     Moves aren't written right away. They are checked and queued, and    │
+# │     then all written at once, in ROM order, by `session.write`. If the   │
+# │     same destination is moved to more than once, the last move wins.     │
+# │                                                                          │
 # │     Because the input and output files are different, performing         │
-# │     > move(file1, file2)                                                 │
-# │     > move(file2, file1)                                                 │
+# │     > session.move(file1, file2)                                         │
+# │     > session.move(file2, file1)                                         │
 # │     results in file1 and file2 swapping data.                            │
 # │                                                                          │
-# │ move_path(source_path, destination_path)                                 │
+# │ session.move_path(source_path, destination_path)                         │
 # │     Convenience wrapper around `move` that calls `root.get_path` for     │
 # │     each input path.                                                     │
 # │                                                                          │
-# │ swap(file1, file2)                                                       │
+# │ session.swap(file1, file2)                                               │
 # │     Swaps file1 and file2. Because the input and output files are        │
 # │     different, this is implemented with two `move`s.                     │
 # │                                                                          │
-# │ swap_path(path1, path2)                                                  │
+# │ session.swap_path(path1, path2)                                          │
 # │     Convenience wrapper around `swap` that calls `root.get_path` for     │
 # │     each input path.                                                     │
 # │                                                                          │
+# │ root.find(pattern, regex=False)                                          │
+# │     Returns a (path, file, match) for every path matching pattern, a     │
+# │     glob like "model/fieldchar/cha01?_*" where wildcards don't cross     │
+# │     directories, except "**". With regex set, pattern is a regular       │
+# │     expression instead. Both are checked against whole paths.            │
+# │                                                                          │
+# │ session.find(pattern, regex=False)                                       │
+# │     Same as `root.find`, but only returns the file objects.              │
+# │                                                                          │
+# │ session.move_matching(source_pattern, destination_pattern, regex=False)  │
+# │     Moves every file matching source_pattern to the files matching       │
+# │     destination_pattern, all in one go. Each wildcard in source_pattern  │
+# │     captures what it matched, and "{1}", "{2}", ... in                   │
+# │     destination_pattern are replaced with those captures, so             │
+# │     > session.move_matching("model/fieldchar/cha02_*",                   │
+# │     >                       "model/fieldchar/cha01?_{1}")                │
+# │     moves every animation of Rosie onto the same animation of every      │
+# │     variation of Hunter. Wildcards left in destination_pattern can       │
+# │     match more than one file. With regex set, source_pattern is a        │
+# │     regular expression and destination_pattern is a replacement like     │
+# │     for `re.sub` ("\1", "\g<name>"), which has to be an exact path.      │
+# │     Returns the number of moves.                                         │
+# │                                                                          │
+# │ session.swap_matching(pattern1, pattern2, regex=False)                   │
+# │     Same as `move_matching`, but swaps each pair of files.               │
+# │                                                                          │
 # │ get_character(root, character_number, variant)                           │
 # │     Get the character with a given character number and variant.         │
+# │     `session.get_character(character_number, variant)` does the same.    │
 # │                                                                          │
 # │     If variant is an empty string, all variations for that character are │
 # │     returned. If this is used for the source of a move, each variation   │
@@ -498,63 +2821,402 @@ copyfile(input_nds_file, output_nds_file)
 # │     Technically, this returns an array of files, but you shouldn't       │
 # │     need to worry about that.                                            │
 # │                                                                          │
-# │ move_character(source_character, destination_character)                  │
+# │ session.move_character(source_character, destination_character)          │
 # │     Moves the model data of source_character to destination_character.   │
+# │     Each model goes to the destination model with the same special trait │
+# │     and animation, and missing animations are filled in from fallbacks.  │
+# │     If a fallback can't be filled in, nothing is moved and an error says │
+# │     which models are missing. Plans are cached, so moving the same       │
+# │     characters again doesn't redo any of this.                           │
 # │                                                                          │
-# │ swap_characters(character1, character2)                                  │
+# │ session.swap_characters(character1, character2)                          │
 # │     Swaps character1 and character2. Same as `swap` but with characters. │
+# │                                                                          │
+# │ session.write()                                                          │
+# │     Writes every queued move to output_nds_file. This is called after    │
+# │     `custom_commands`, so custom commands don't need to call it.         │
+# │     In patch mode, each call writes a new patch over the last one, which │
+# │     includes every move from the earlier calls too.                      │
 # ╰──────────────────────────────────────────────────────────────────────────╯
 
-if not CUSTOM_MODE:
-	all_hunters = get_character(root, 1, "")
-	hunter_deinonychus = get_character(root, 1, "c")
-	input_character = get_character(root, character_number, character_variation)
-	move_character(input_character, all_hunters)
-	move_character(hunter_deinonychus, input_character)
-	if IS_EXE:
+def swap_with_hunter(session, character_number, character_variation):
+	all_hunters = session.get_character(1, "")
+	hunter_deinonychus = session.get_character(1, "c")
+	input_character = session.get_character(character_number, character_variation)
+	session.move_character(input_character, all_hunters)
+	session.move_character(hunter_deinonychus, input_character)
+
+def custom_commands(session):
+	root = session.root
+	
+	# Any code that you add here will only be run in custom mode
+	
+	# MARK: Examples
+	
+	# replace t-rex hunter head with rosie head
+	# hunter_head = root.get_path("model/fieldchar/head01a")
+	# rosie_head = root.get_path("model/fieldchar/head02")
+	# session.move(hunter_head, rosie_head)
+	
+	# replace t-rex hunter head with rosie head
+	# session.move_path("model/fieldchar/head01a", "model/fieldchar/head02")
+	
+	# swap t-rex hunter head and rosie head
+	# session.swap_path("model/fieldchar/head01a", "model/fieldchar/head02")
+	
+	# replace t-rex hunter with rosie
+	# session.move_path("model/fieldchar/cha01a_01", "model/fieldchar/cha02_01")
+	# session.move_path("model/fieldchar/cha01a_02", "model/fieldchar/cha02_02")
+	# session.move_path("model/fieldchar/cha01a_03", "model/fieldchar/cha02_03")
+	# session.move_path("model/fieldchar/cha01a_04", "model/fieldchar/cha02_04")
+	# session.move_path("model/fieldchar/cha01a_06", "model/fieldchar/cha02_06")
+	# session.move_path("model/fieldchar/cha01a_08", "model/fieldchar/cha02_08")
+	# session.move_path("model/fieldchar/cha01a_10", "model/fieldchar/cha02_10")
+	# session.move_path("model/fieldchar/cha01a_11", "model/fieldchar/cha02_11")
+	# session.move_path("model/fieldchar/cha01a_12", "model/fieldchar/cha02_12")
+	# session.move_path("model/fieldchar/cha01a_13", "model/fieldchar/cha02_13")
+	# session.move_path("model/fieldchar/cha01a_15", "model/fieldchar/cha02_15")
+	# session.move_path("model/fieldchar/cha01a_79", "model/fieldchar/cha02_79")
+	# session.move_path("model/fieldchar/cha01a_80", "model/fieldchar/cha02_80")
+	# session.move_path("model/fieldchar/cha01a_81", "model/fieldchar/cha02_81")
+	# session.move_path("model/fieldchar/cha01a_82", "model/fieldchar/cha02_82")
+	# session.move_path("model/fieldchar/cha01_ice_01", "model/fieldchar/cha02_ice_01")
+	# session.move_path("model/fieldchar/head01a", "model/fieldchar/head02")
+	
+	# replace t-rex hunter with rosie
+	# hunter = session.get_character(1, "")
+	# rosie = session.get_character(2, "a")
+	# session.move_character(hunter, rosie)
+	
+	# swap t-rex hunter and rosie
+	# hunter = session.get_character(1, "")
+	# rosie = session.get_character(2, "a")
+	# session.swap_characters(hunter, rosie)
+
+def print_stats(stats, report, stats_file):
+	print()
+	print(stats.summary())
+	if stats_file:
+		with open(stats_file, "w") as file:
+			json.dump(report, file, indent=2)
+		print(f"Saved stats to '{stats_file}'")
+
+def print_duplicates(rom):
+	groups = rom.content_index().duplicates()
+	for group in groups:
+		length = group[0][1].length
+		print(f"{len(group)} files, {format_size(length)} each:")
+		for path, _ in group:
+			print(f"    {path}")
+	
+	wasted = sum(group[0][1].length * (len(group) - 1) for group in groups)
+	print(f"\n{len(groups)} groups of duplicate files, {format_size(wasted)} duplicated")
+
+def run_command_line(argv):
+	# MARK: apply
+	if len(argv) > 1 and argv[1].lower() == "apply":
+		if len(argv) < 4:
+			error("Usage: python ff1_asset_swapper.py apply patch_file input_nds_file [output_nds_file]")
+		
+		patch_file, input_nds_file = argv[2], argv[3]
+		if len(argv) > 4:
+			output_nds_file = argv[4]
+		else:
+			output_nds_file = f"{patch_file.rsplit('.', 1)[0]}.nds"
+		
+		for file_name in [patch_file, input_nds_file]:
+			if not isfile(file_name):
+				error(f"Input file does not exist: '{file_name}'")
+		
+		apply_patch(patch_file, input_nds_file, output_nds_file)
+		print(f"Patched '{input_nds_file}' into '{output_nds_file}'")
+		return
+	
+	# MARK: duplicates
+	if len(argv) > 1 and argv[1].lower() == "duplicates":
+		if len(argv) < 3:
+			error("Usage: python ff1_asset_swapper.py duplicates input_nds_file")
+		if not isfile(argv[2]):
+			error(f"Input file does not exist: '{argv[2]}'")
+		
+		print_duplicates(Rom(argv[2]))
+		return
+	
+	# MARK: list
+	if len(argv) > 1 and argv[1].lower() == "list":
+		if len(argv) < 3:
+			error("Usage: python ff1_asset_swapper.py list input_nds_file [pattern] [listing_file]")
+		if not isfile(argv[2]):
+			error(f"Input file does not exist: '{argv[2]}'")
+		
+		arguments = argv[3:]
+		listing_file = None
+		if arguments and arguments[-1].lower().endswith((".csv", ".json")):
+			listing_file = arguments.pop()
+		pattern = arguments[0] if arguments else None
+		
+		listing = list_files(Rom(argv[2]).root, pattern)
+		if listing_file:
+			export_listing(listing, listing_file)
+			print(f"Saved {len(listing)} entries to '{listing_file}'")
+		else:
+			print_listing(listing)
+		return
+	
+	# MARK: extract
+	if len(argv) > 1 and argv[1].lower() == "extract":
+		if len(argv) < 4:
+			error("Usage: python ff1_asset_swapper.py extract input_nds_file output_directory [pattern]")
+		if not isfile(argv[2]):
+			error(f"Input file does not exist: '{argv[2]}'")
+		
+		count, size = extract(Rom(argv[2]), argv[3], argv[4] if len(argv) > 4 else None)
+		print(f"Extracted {count} files ({format_size(size)}) to '{argv[3]}'")
+		return
+	
+	# MARK: repack
+	if len(argv) > 1 and argv[1].lower() == "repack":
+		if len(argv) < 4:
+			error("Usage: python ff1_asset_swapper.py repack input_nds_file input_directory [output_nds_file]")
+		if not isfile(argv[2]):
+			error(f"Input file does not exist: '{argv[2]}'")
+		
+		output_nds_file = argv[4] if len(argv) > 4 else f"{argv[2][:-4]} - repacked.nds"
+		count = repack(Rom(argv[2]), argv[3], output_nds_file)
+		print(f"Repacked {count} changed files into '{output_nds_file}'")
+		return
+	
+	# MARK: models
+	if len(argv) > 1 and argv[1].lower() == "models":
+		if len(argv) < 3:
+			error("Usage: python ff1_asset_swapper.py models input_nds_file [pattern]")
+		if not isfile(argv[2]):
+			error(f"Input file does not exist: '{argv[2]}'")
+		
+		rom = Rom(argv[2])
+		with rom.stats.phase("decompress models"):
+			models = list_models(rom, argv[3] if len(argv) > 3 else "model/fieldchar/*")
+		for path, kind, model in models:
+			print(f"{path} ({COMPRESSION_LABELS.get(kind, 'raw')}): {model}")
+		print(f"Read {len(models)} models in {rom.stats.phases['decompress models']:.3f}s")
+		return
+	
+	# MARK: coverage
+	if len(argv) > 1 and argv[1].lower() == "coverage":
+		if len(argv) < 3:
+			error("Usage: python ff1_asset_swapper.py coverage input_nds_file")
+		if not isfile(argv[2]):
+			error(f"Input file does not exist: '{argv[2]}'")
+		
+		root = Rom(argv[2]).root
+		if root.characters is None:
+			error("No character models found in 'model/fieldchar'")
+		print(describe_coverage(root.characters, ANIMATION_FALLBACKS))
+		return
+	
+	# MARK: DEBUG
+	debug = len(argv) > 1 and argv[1].lower() == "debug"
+	if debug:
+		argv.pop(1)
+		print("debug mode enabled")
+	
+	# MARK: CUSTOM_MODE
+	custom_mode = len(argv) > 1 and argv[1].lower() == "custom"
+	if custom_mode:
+		argv.pop(1)
+		print("custom mode enabled")
+	
+	# MARK: ADD_WEIRD_SPRINT
+	weird_sprint = not (len(argv) > 1 and argv[1].lower() in ["-d", "--disable-weird-sprint"])
+	if not weird_sprint:
+		argv.pop(1)
+		print("Disabling ADD_WEIRD_SPRINT")
+	
+	# MARK: POINTER_MODE
+	pointer_mode = len(argv) > 1 and argv[1].lower() in ["-p", "--pointers"]
+	if pointer_mode:
+		argv.pop(1)
+		print("pointer mode enabled")
+	
+	# MARK: MM3_MODE
+	mm3_mode = len(argv) > 1 and argv[1].lower() == "--mm3"
+	if mm3_mode:
+		argv.pop(1)
+		print("MM3 mode enabled")
+		if pointer_mode:
+			error("MM3_MODE and POINTER_MODE can't be used together")
+	
+	# MARK: PATCH_MODE
+	patch_format = None
+	if len(argv) > 1 and argv[1].lower() in ["--ips", "--bps"]:
+		patch_format = argv.pop(1).lower()[2:]
+		print(f"{patch_format.upper()} patch mode enabled")
+		if mm3_mode:
+			error("MM3_MODE can move files to the end of the ROM, which patches can't do")
+	
+	# MARK: STATS
+	show_stats = len(argv) > 1 and argv[1].lower().startswith("--stats")
+	stats_file = None
+	if show_stats:
+		_, _, stats_file = argv.pop(1).partition("=")
+		stats_file = stats_file or None
+		print("stats enabled")
+	
+	# MARK: DEDUP
+	dedup = len(argv) > 1 and argv[1].lower() == "--dedup"
+	if dedup:
+		argv.pop(1)
+		print("dedup enabled")
+	
+	# MARK: VERIFY
+	verify = len(argv) > 1 and argv[1].lower() == "--verify"
+	if verify:
+		argv.pop(1)
+		print("verify enabled")
+		if patch_format:
+			error("Patches can't be verified, apply them first")
+	
+	# MARK: FULL_HASH
+	full_hash = len(argv) > 1 and argv[1].lower() == "--full-hash"
+	if full_hash:
+		argv.pop(1)
+		print("full hash enabled")
+	
+	# MARK: BATCH_MODE
+	batch_mode = len(argv) > 1 and argv[1].lower() == "batch"
+	if batch_mode:
+		argv.pop(1)
+		print("batch mode enabled")
+		if custom_mode:
+			error("Custom mode can't be used in batch mode")
+	
+	# MARK: PLAN_MODE
+	plan_file = None
+	if not batch_mode and len(argv) > 1 and argv[1].lower() == "plan":
+		argv.pop(1)
+		if custom_mode:
+			error("Custom mode can't be used with a plan")
+		if len(argv) < 2:
+			error("Usage: python ff1_asset_swapper.py plan plan_file input_nds_file output_name")
+		
+		plan_file = argv.pop(1)
+		if not isfile(plan_file):
+			error(f"Plan file does not exist: '{plan_file}'")
+		operations = load_plan(plan_file)
+		print(f"Using plan '{plan_file}' ({len(operations)} operations)")
+	
+	output_extension = patch_format or "nds"
+	
+	# MARK: input_nds_file
+	if len(argv) > 1:
+		input_nds_file = argv.pop(1)
+		
+		if not isfile(input_nds_file):
+			error(f"Input file does not exist: '{input_nds_file}'")
+	else:
+		nds_files = sorted(glob("*.nds"))
+		
+		if len(nds_files) == 0:
+			error("No nds files found in current directory")
+		elif len(nds_files) == 1:
+			input_nds_file = nds_files[0]
+		else:
+			print("Found nds files:")
+			for index, file_name in enumerate(nds_files):
+				print(f"    [{index}] - {file_name}")
+			
+			try:
+				input_nds_file_index = int(input("Pick an nds file as input: "))
+				assert(input_nds_file_index >= 0)
+				input_nds_file = nds_files[input_nds_file_index]
+			except:
+				error("Invalid index")
+	
+	print(f"Using '{input_nds_file}' as input file", end="\n\n")
+	
+	# MARK: output_nds_file
+	if batch_mode:
+		character_specs = argv[1:] or ["all"]
+	else:
+		if len(argv) > 1:
+			output_name = argv.pop(1)
+			output_nds_file = f"{input_nds_file[:-4]} - {output_name}.{output_extension}"
+		else:
+			output_name = input("Pick a name for the output file (ex: Rosie mod): ")
+			output_nds_file = f"{input_nds_file[:-4]} - {output_name}.{output_extension}"
+			
+			if isfile(output_nds_file):
+				overwrite = input(f"File '{output_nds_file}' already exists, do you want to overwrite it [y/N]? ")
+				if not overwrite.lower().startswith("y"):
+					error("Aborting...")
+		
+		print(f"Using '{output_nds_file}' as output file", end="\n\n")
+	
+	if not custom_mode and not batch_mode and not plan_file:
+		if len(argv) > 1:
+			character_number = argv.pop(1)
+		else:
+			character_number = input("Which character would you like to swap with Hunter? ")
+		
+		character_number, character_variation = parse_character(character_number)
+		
+		print(f"Swapping Hunter with character {character_number}{character_variation}")
+	
+	rom = Rom(input_nds_file, full_hash=full_hash)
+	options = dict(weird_sprint=weird_sprint, pointer_mode=pointer_mode, patch_format=patch_format, dedup=dedup, verify=verify, mm3_mode=mm3_mode, debug=debug)
+	
+	if batch_mode:
+		start = perf_counter()
+		character_specs = batch_character_specs(rom.root, character_specs)
+		print(f"Building {len(character_specs)} variants", end="\n\n")
+		
+		failures = 0
+		stats = Stats()
+		stats.merge(rom.stats)
+		variant_reports = {}
+		for character_spec, seconds, output, failure, report in build_batch(rom, character_specs, **options):
+			stats.merge(Stats.from_report(report))
+			variant_reports[character_spec] = report
+			if debug:
+				print(output, end="")
+			if failure:
+				failures += 1
+				print(f"\033[31m    {character_spec:<6}{seconds:8.3f}s  failed: {failure}\033[0m")
+			else:
+				print(f"    {character_spec:<6}{seconds:8.3f}s  ok")
+		
+		print(f"\nBuilt {len(character_specs) - failures}/{len(character_specs)} variants in {perf_counter() - start:.3f}s")
+		if show_stats:
+			report = stats.report()
+			report["variants"] = variant_reports
+			print_stats(stats, report, stats_file)
+		if failures:
+			error(f"{failures} variants failed")
+	else:
+		session = Session(rom, output_nds_file, **options)
+		if custom_mode:
+			custom_commands(session)
+		elif plan_file:
+			run_plan(session, operations)
+			print(describe_plan(session), end="\n\n")
+		else:
+			swap_with_hunter(session, character_number, character_variation)
+		session.write()
+		
+		if show_stats:
+			stats = Stats()
+			stats.merge(rom.stats)
+			stats.merge(session.stats)
+			print_stats(stats, stats.report(), stats_file)
+	
+	if IS_EXE and not custom_mode:
 		input("Press Return to exit...")
-	exit()
 
-# Any code that you add here will only be run in custom mode
-
-# MARK: Examples
-
-# replace t-rex hunter head with rosie head
-# hunter_head = root.get_path("model/fieldchar/head01a")
-# rosie_head = root.get_path("model/fieldchar/head02")
-# move(hunter_head, rosie_head)
-
-# replace t-rex hunter head with rosie head
-# move_path("model/fieldchar/head01a", "model/fieldchar/head02")
-
-# swap t-rex hunter head and rosie head
-# swap_path("model/fieldchar/head01a", "model/fieldchar/head02")
-
-# replace t-rex hunter with rosie
-# move_path("model/fieldchar/cha01a_01", "model/fieldchar/cha02_01")
-# move_path("model/fieldchar/cha01a_02", "model/fieldchar/cha02_02")
-# move_path("model/fieldchar/cha01a_03", "model/fieldchar/cha02_03")
-# move_path("model/fieldchar/cha01a_04", "model/fieldchar/cha02_04")
-# move_path("model/fieldchar/cha01a_06", "model/fieldchar/cha02_06")
-# move_path("model/fieldchar/cha01a_08", "model/fieldchar/cha02_08")
-# move_path("model/fieldchar/cha01a_10", "model/fieldchar/cha02_10")
-# move_path("model/fieldchar/cha01a_11", "model/fieldchar/cha02_11")
-# move_path("model/fieldchar/cha01a_12", "model/fieldchar/cha02_12")
-# move_path("model/fieldchar/cha01a_13", "model/fieldchar/cha02_13")
-# move_path("model/fieldchar/cha01a_15", "model/fieldchar/cha02_15")
-# move_path("model/fieldchar/cha01a_79", "model/fieldchar/cha02_79")
-# move_path("model/fieldchar/cha01a_80", "model/fieldchar/cha02_80")
-# move_path("model/fieldchar/cha01a_81", "model/fieldchar/cha02_81")
-# move_path("model/fieldchar/cha01a_82", "model/fieldchar/cha02_82")
-# move_path("model/fieldchar/cha01_ice_01", "model/fieldchar/cha02_ice_01")
-# move_path("model/fieldchar/head01a", "model/fieldchar/head02")
-
-# replace t-rex hunter with rosie
-# hunter = get_character(root, 1, "")
-# rosie = get_character(root, 2, "a")
-# move_character(hunter, rosie)
-
-# swap t-rex hunter and rosie
-# hunter = get_character(root, 1, "")
-# rosie = get_character(root, 2, "a")
-# swap_characters(hunter, rosie)
+def main():
+	try:
+		run_command_line(list(argv))
+	except SwapError as exception:
+		error(str(exception))
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,156 @@
+# ╭─────────────────────────────────────────────────────────────────────────╮
+# │ Synthetic ROM generator                                                 │
+# ├─────────────────────────────────────────────────────────────────────────┤
+# │ Builds a valid (but unplayable) nds ROM with the same layout that       │
+# │ ff1_asset_swapper.py expects, so it can be tested and benchmarked       │
+# │ without a copy of Fossil Fighters.                                      │
+# │                                                                         │
+# │ The ROM has a `model/fieldchar` directory filled with character models  │
+# │ named like the real ones (cha01a_01, cha02_ice_01, head03b, ...), plus  │
+# │ any number of filler directories and files. Every model is the same     │
+# │ size, so any two of them can be swapped.                                │
+# ├─────────────────────────────────────────────────────────────────────────┤
+# │ Usage                                                                   │
+# ├─────────────────────────────────────────────────────────────────────────┤
+# │ python synthetic_rom.py output_nds_file [directories]                   │
+# │      [files_per_directory] [asset_size] [file_size]                     │
+# │                                                                         │
+# │ directories                                                             │
+# │     How many filler directories to add (default 64). These are split    │
+# │     into groups of 64, so large values also make the tree deeper.       │
+# │                                                                         │
+# │ files_per_directory                                                     │
+# │     How many files each filler directory has (default 16).              │
+# │                                                                         │
+# │ asset_size                                                              │
+# │     The size of each character model, in bytes (default 64).           │
+# │                                                                         │
+# │ file_size                                                               │
+# │     The size of each filler file, in bytes (default 256).               │
+# ╰─────────────────────────────────────────────────────────────────────────╯
+
+from random import Random
+from struct import pack, pack_into
+from sys import argv
+
+ANIMATIONS = [1, 2, 3, 4, 6, 8, 10, 11, 12, 13, 15, 79, 80, 81, 82]
+SPECIAL_TRAITS = ["ice", "rock", "paralysis"]
+
+def crc16(data):
+	crc = 0xFFFF
+	for byte in data:
+		crc ^= byte
+		for _ in range(8):
+			crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+	return crc
+
+def character_variations(character_number):
+	if character_number == 1:
+		return "abcdefgh"
+	elif character_number % 5 == 1:
+		return "ab"
+	else:
+		return ""
+
+def fieldchar_names(characters=48):
+	names = []
+	for character_number in range(characters):
+		for variation in character_variations(character_number) or [""]:
+			for animation_number in ANIMATIONS:
+				# some characters don't have a sprint animation, like in the real ROM
+				if animation_number == 3 and character_number % 4 == 3:
+					continue
+				names.append(f"cha{character_number:02}{variation}_{animation_number:02}")
+			names.append(f"head{character_number:02}{variation}")
+		
+		if character_number in [1, 2, 4]:
+			for special_trait in SPECIAL_TRAITS:
+				names.append(f"cha{character_number:02}_{special_trait}_01")
+	return names
+
+def build_tree(directories=64, files_per_directory=16, asset_size=0x40, file_size=0x100, characters=48, seed=0):
+	random = Random(seed)
+	
+	tree = {"model": {"fieldchar": {name: random.randbytes(asset_size) for name in fieldchar_names(characters)}}}
+	for index in range(directories):
+		group = tree.setdefault(f"group{index // 64:03}", {})
+		group[f"dir{index:05}"] = {f"file{x:05}.bin": random.randbytes(file_size) for x in range(files_per_directory)}
+	return tree
+
+def build_rom(tree, overlays=2, alignment=0x200):
+	directories = []
+	def add_directory(node, parent_id):
+		index = len(directories)
+		directories.append((node, parent_id, []))
+		for child in node.values():
+			if isinstance(child, dict):
+				directories[index][2].append(add_directory(child, 0xF000 + index))
+		return 0xF000 + index
+	add_directory(tree, None)
+	
+	files = [bytes(0x20)] * overlays
+	first_child_ids = []
+	for node, _, _ in directories:
+		first_child_ids.append(len(files))
+		files.extend(child for child in node.values() if not isinstance(child, dict))
+	
+	if len(files) > 0xF000 or len(directories) > 0x1000:
+		raise ValueError(f"Too many files ({len(files)}) or directories ({len(directories)}) for an nds file table")
+	
+	sub_tables = []
+	for node, _, subdirectory_ids in directories:
+		sub_table = bytearray()
+		subdirectory_ids = iter(subdirectory_ids)
+		for name, child in node.items():
+			name = name.encode()
+			if isinstance(child, dict):
+				sub_table += bytes([len(name) | 0x80]) + name + pack("<H", next(subdirectory_ids))
+			else:
+				sub_table += bytes([len(name)]) + name
+		sub_tables.append(sub_table + b"\0")
+	
+	name_table = bytearray()
+	sub_table_offset = len(directories) * 8
+	for index, (_, parent_id, _) in enumerate(directories):
+		if parent_id is None:
+			parent_id = len(directories)
+		name_table += pack("<IHH", sub_table_offset, first_child_ids[index], parent_id)
+		sub_table_offset += len(sub_tables[index])
+	for sub_table in sub_tables:
+		name_table += sub_table
+	
+	def align(offset):
+		return (offset + alignment - 1) // alignment * alignment
+	
+	name_table_offset = 0x4000
+	allocation_table_offset = align(name_table_offset + len(name_table))
+	
+	allocation_table = bytearray()
+	offset = align(allocation_table_offset + len(files) * 8)
+	for data in files:
+		allocation_table += pack("<II", offset, offset + len(data))
+		offset = align(offset + len(data))
+	
+	rom = bytearray(offset)
+	rom[0:12] = b"SYNTHETICROM"
+	pack_into("<IIII", rom, 0x40, name_table_offset, len(name_table), allocation_table_offset, len(allocation_table))
+	pack_into("<I", rom, 0x80, len(rom))
+	rom[name_table_offset:name_table_offset + len(name_table)] = name_table
+	rom[allocation_table_offset:allocation_table_offset + len(allocation_table)] = allocation_table
+	for index, data in enumerate(files):
+		start = int.from_bytes(allocation_table[index * 8:index * 8 + 4], "little")
+		rom[start:start + len(data)] = data
+	pack_into("<H", rom, 0x15E, crc16(rom[:0x15E]))
+	
+	return rom
+
+def write_rom(output_nds_file, *args, **kwargs):
+	with open(output_nds_file, "wb") as file:
+		file.write(build_rom(build_tree(*args, **kwargs)))
+
+if __name__ == "__main__":
+	if len(argv) < 2:
+		print("Usage: python synthetic_rom.py output_nds_file [directories] [files_per_directory] [asset_size] [file_size]")
+		exit()
+	
+	write_rom(argv[1], *[int(x, 0) for x in argv[2:6]])